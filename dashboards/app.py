@@ -1,200 +1,39 @@
 import streamlit as st
-import pandas as pd
-import datetime as dt
-import os
-import sqlite3
-import plotly.express as px
 import plotly.graph_objects as go
-import pycountry
-import pycountry_convert as pc
 
-from plotly.subplots import make_subplots
+from pandas.core.common import SettingWithCopyWarning
 
+import instrumentation
 import warnings
+from datalayer import (
+    create_continent_dict,
+    create_country_iso_dict,
+    load_dashboard_data,
+    ordinal_to_datetime,
+    plot_cholopleth,
+    plot_daily,
+    plot_fatality,
+    select_daily,
+)
 
-warnings.filterwarnings("ignore")
-
-
-# ------------------------------------------------------------------ #
-# --------------------- Sec.0 Helper functions --------------------- #
-# ------------------------------------------------------------------ #
-
-
-@st.cache
-def project_root():
-    """Get the path to the project root
-
-    Returns:
-        string: path to the project root
-    """
-    os.path.dirname(os.path.abspath(__file__))
-    os.chdir(".")  # one directory above
-    return os.path.abspath(os.curdir)
-
-
-project_root = project_root()
-
-
-@st.cache(allow_output_mutation=True)
-def query_to_df(database=None, query=None):
-    """Create a database connection to the SQLite database specified by the db_file.
-
-    Arguments:
-        db_file {string} -- name of database file
-    Returns:
-        DataFrame -- Contents of the sql query
-    """
-
-    conn = None
-    try:
-        conn = sqlite3.connect(f"{project_root}/{database}.db")
-    except Error as e:
-        print(e)
-    df = pd.read_sql_query(query, conn)
-
-    return df
-
-
-@st.cache(allow_output_mutation=True)
-def create_country_iso_dict(df, iso):
-    """Returns a ISO 3166-1 alpha-2 code for each countries based on the country name
-
-    Args:
-        df (DataFrame): data that contains a column of country names
-
-    Returns:
-        dictionary: dictionary takes country name as key, and iso code as value
-    """
-
-    c_list = df["country"].unique().tolist()
-    country_iso_dict = {}
-    for country in c_list:
-        try:
-            if iso == "iso2":
-                iso_code = pycountry.countries.search_fuzzy(country)[0].alpha_2
-            elif iso == "iso3":
-                iso_code = pycountry.countries.search_fuzzy(country)[0].alpha_3
-        except:
-            iso_code = "N/A"
-        country_iso_dict[country] = iso_code
-    return country_iso_dict
-
-
-@st.cache
-def create_continent_dict(dict):
-
-    continent_dict = {}
-    codename = {
-        "AS": "Asia",
-        "EU": "Europe",
-        "AF": "Africa",
-        "NA": "North America",
-        "SA": "South America",
-        "OC": "Oceania",
-    }
-    for key, value in dict.items():
-        try:
-            continent = codename[pc.country_alpha2_to_continent_code(value)]
-        except:
-            continent = "N/A"
-        continent_dict[key] = continent
-    return continent_dict
-
-
-def plot_daily(df, metric):
-    """Plots the daily infected or death in two axis - histogram for daily, line plot for cumulative
-
-    Args:
-        df (DataFrame): contains the data to plot, requires column for data and metric
-        metric (string): label of the column to plot. needs to exist in df
-    """
-
-    renames = {"confirmed": "Infections", "death": "Deaths"}
-    label = renames[metric]
-    df["csum"] = df[metric].cumsum()
-
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(go.Bar(name="Daily", x=df["date"], y=df[metric]), secondary_y=False)
-    fig.add_trace(
-        go.Scatter(name="Running Total", x=df["date"], y=df["csum"]), secondary_y=True,
-    )
-    fig.update_layout(
-        title_text=f"<b>{label} over time</b>".upper(),
-        legend_orientation="h",
-        width=800,
-        height=500,
-    )
-    fig.update_xaxes(title_text="Date")
-    fig.update_yaxes(title_text=f"Daily {label}", secondary_y=False)
-    fig.update_yaxes(title_text=f"Total {label}", secondary_y=True)
-    st.plotly_chart(fig)
-
+# the plots add their running totals to slices of the loaded data on purpose
+warnings.filterwarnings("ignore", category=SettingWithCopyWarning)
 
-def plot_fatality(fig, df, state=False):
-    """Plots the fatality over infected cases ratios over time
-
-    Args:
-        fig (plotly figure): plotly figure to chart the data onto
-        df (DataFrame): data containing both infected and death cases over time
-        state (bool, optional): flag for whether to chart based on state or country. Defaults to False.
-    """
-
-    if state == False:
-        line_label = df["country"].iloc[0]
-    else:
-        line_label = df["state"].iloc[0]
-    df["csum_death"] = df["death"].cumsum()
-    df["csum_confirmed"] = df["confirmed"].cumsum()
-    df["case_fatality_ratio"] = df["csum_death"] / df["csum_confirmed"] * 1000
-    fig.add_trace(
-        go.Scatter(
-            x=df["date"], y=df["case_fatality_ratio"], mode="lines", name=line_label
-        )
-    )
-    fig.update_layout(
-        title_text=f"<b>Deaths per 1000 Infections</b>".upper(),
-        legend_orientation="h",
-        width=750,
-        height=500,
-    )
-    fig.update_xaxes(title_text="Date")
-    fig.update_yaxes(title_text=f"Fatality Rate")
+instrumentation.start_metrics_server()
 
 
 # ------------------------------------------------------------------------------ #
 # --------------------- Sec.1 Loading data into DataFrames --------------------- #
 # ------------------------------------------------------------------------------ #
 
-
-country_overall = query_to_df(
-    database="covid_master", query="SELECT * FROM country_overall"
-)
-
-country_daily = query_to_df(
-    database="covid_master", query="SELECT * FROM country_daily"
-)
-
-state_daily = query_to_df(
-    database="covid_master", query="SELECT * FROM state_daily WHERE state IS NOT NULL"
-)
-
-coordinates_overall = query_to_df(
-    database="covid_master",
-    query="SELECT latitude, longitude, confirmed FROM log_lat_overall",
-)
-
-daily_overall = query_to_df(
-    database="covid_master",
-    query="""
-    SELECT date, sum(confirmed) confirmed, sum(death) death
-    FROM country_daily
-    GROUP BY date
-    """,
-)
-
-world_population = query_to_df(
-    database="population", query="SELECT * FROM world_population"
-)
+# data and figure code lives in datalayer.py, so it can be driven without a browser (see loadtest.py)
+data = load_dashboard_data()
+country_overall = data["country_overall"]
+country_daily = data["country_daily"]
+state_daily = data["state_daily"]
+coordinates_overall = data["coordinates_overall"]
+daily_overall = data["daily_overall"]
+world_population = data["world_population"]
 
 countries_w_states = state_daily["country"].unique().tolist()
 
@@ -230,7 +69,7 @@ if segmentation == "By Countries":
     selection = st.sidebar.selectbox(
         label="Select the countries to display", options=ordered_list,
     )
-    df = country_daily[country_daily["country"] == selection]
+    df = select_daily(data, country=selection)
 
     if selection in countries_w_states:
         show_state = st.sidebar.checkbox("Breakdown by state/province")
@@ -240,14 +79,16 @@ if segmentation == "By Countries":
             state = st.sidebar.selectbox(
                 label="Select the state to display", options=state_list
             )
-            df = state_daily[state_daily["state"] == state]
+            df = select_daily(data, country=selection, state=state)
 
 elif segmentation == "Global":
-    df = daily_overall
-    df["country"] = "Global"
+    df = select_daily(data)
 
 st.sidebar.markdown("----")
 
+# hidden unless DASHBOARD_DEBUG is set
+instrumentation.debug_panel()
+
 
 # ------------------------------------------------------------------ #
 # --------------------- Sec.3 Set up variables --------------------- #
@@ -255,7 +96,7 @@ st.sidebar.markdown("----")
 
 
 # date of the last data import
-max_date = max(pd.to_datetime(daily_overall["date"])).strftime("%B %d, %Y")
+max_date = ordinal_to_datetime(daily_overall["date"].max()).strftime("%B %d, %Y")
 
 # for global cases
 global_cases = country_overall["confirmed"].sum()
@@ -299,8 +140,8 @@ if segmentation == "By Countries":
     )
 
 # plot daily and running total cases
-plot_daily(df, "confirmed")
-plot_daily(df, "death")
+instrumentation.plotly_chart("plot_daily_confirmed", plot_daily(df, "confirmed"))
+instrumentation.plotly_chart("plot_daily_death", plot_daily(df, "death"))
 
 # plot death per infection chart
 fig_line = go.Figure()
@@ -314,39 +155,17 @@ if segmentation == "By Countries":
             plot_fatality(fig_line, df, state=True)
         else:
             plot_fatality(fig_line, df)
-st.plotly_chart(fig_line)
+instrumentation.plotly_chart("plot_fatality", fig_line)
 
 st.markdown("----")
 
-# TODO: chroploth map - add over time filters or animation
-
-@st.cache
-def plot_cholopleth(df):
-
-    df["iso2"] = df["country"].map(iso2_dict)
-    df["iso3"] = df["country"].map(iso3_dict)
-    df["continent"] = df["country"].map(continent_dict)
-    df["date_formatted"] = pd.to_datetime(
-        df["date"], format="%Y-%m-%d", errors="ignore"
-    ).astype(str)
-    cholo_fig = px.choropleth(
-        df,
-        locations="iso3",
-        color="confirmed",
-        hover_name="country",
-        color_continuous_scale=px.colors.sequential.matter,
-        animation_frame="date_formatted",
-    )
-
-    return cholo_fig
-
 #merges
 # world_population["iso3"] = world_population["country"].map(iso3_dict)
 # map_data = pd.merge(country_daily, world_population, how="left", on="iso3")
 
-global_fig = plot_cholopleth(country_daily)
+global_fig = plot_cholopleth(country_daily, iso2_dict, iso3_dict, continent_dict)
 global_fig.update_layout(width=750, height=520, margin={"r": 1, "l": 1, "b": 0})
-st.plotly_chart(global_fig)
+instrumentation.plotly_chart("plot_cholopleth", global_fig)
 
 
 # scatter_geo_fig = px.choropleth(
@@ -0,0 +1,148 @@
+"""Timing of the date handling of covid_daily, integer day ordinals against the former text dates
+
+Times two things:
+the parsing of the MM/DD/YY headers of a source, CovidPipeline.format_dates() against the strptime call per header it replaced,
+and `WHERE date BETWEEN` range queries on the same synthetic rows (synthetic.synthetic_body()),
+stored once with TEXT dates as pandas wrote datetimes before ('2020-01-22 00:00:00') and once with INTEGER days since 1970-01-01,
+both with an index on date.
+
+    python dashboards/bench_dates.py --headers 1000 --locations 4000 --days 365 --queries 100
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.constants import ETLConfigs
+from etl.covid_daily import CovidPipeline
+from synthetic import FIRST_DAY, synthetic_body
+
+RANGE_QUERY = """
+SELECT date, SUM(confirmed) AS confirmed, SUM(death) AS death
+FROM {table}
+WHERE date BETWEEN ? AND ?
+GROUP BY date
+"""
+
+
+def summarize(seconds):
+    ms = np.asarray(seconds) * 1000
+    p50, p95 = np.percentile(ms, [50, 95])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3)}
+
+
+def time_headers(n_headers, repeat):
+    """Times the parsing of n_headers date headers, both ways
+
+    Returns:
+        dictionary: latency percentiles of each parser
+    """
+
+    dates = pd.date_range(dt.date(2020, 1, 22), periods=n_headers)
+    headers = [f"{d.month}/{d.day}/{d:%y}" for d in dates]
+    pipeline = CovidPipeline()
+    parsers = {
+        "strptime_per_header": lambda: [
+            dt.datetime.strptime(h, ETLConfigs.DATE_FORMAT) for h in headers
+        ],
+        "format_dates": lambda: pipeline.format_dates(headers),
+    }
+    results = {}
+    for name, parse in parsers.items():
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse()
+            seconds.append(time.perf_counter() - start)
+        results[name] = summarize(seconds)
+    return results
+
+
+def build_tables(conn, n_locations, n_days, seed=0):
+    """Writes the same rows to covid_text and covid_integer, each with an index on date
+    """
+
+    rng = np.random.RandomState(seed)
+    locations = pd.DataFrame(
+        {
+            "country": [f"C{i % 200}" for i in range(n_locations)],
+            "state": [f"S{i}" for i in range(n_locations)],
+            "latitude": rng.uniform(-60, 70, n_locations).round(4),
+            "longitude": rng.uniform(-180, 180, n_locations).round(4),
+        }
+    )
+    body = synthetic_body(locations, n_days, seed)
+    text = body.assign(
+        date=pd.to_datetime(body["date"], unit="D").dt.strftime("%Y-%m-%d %H:%M:%S")
+    )
+    for table, df, dtype in [
+        ("covid_integer", body, "INTEGER"),
+        ("covid_text", text, "TEXT"),
+    ]:
+        df.to_sql(table, conn, index=False, dtype={"date": dtype})
+        conn.execute(f"CREATE INDEX {table}_date_idx ON {table} (date)")
+    conn.commit()
+
+
+def time_ranges(conn, n_days, n_queries, seed=0):
+    """Times random date ranges, from a week to the whole series, on both tables
+
+    Returns:
+        dictionary: latency percentiles and mean rows returned of each table
+    """
+
+    rng = np.random.RandomState(seed)
+    timings = {"covid_integer": ([], []), "covid_text": ([], [])}
+    for _ in range(n_queries):
+        length = rng.randint(7, n_days + 1)
+        first = FIRST_DAY + rng.randint(0, n_days - length + 1)
+        days = [first, first + length - 1]
+        bounds = {
+            "covid_integer": days,
+            "covid_text": [str(pd.Timestamp(day, unit="D")) for day in days],
+        }
+        for table, (seconds, rows) in timings.items():
+            start = time.perf_counter()
+            result = conn.execute(
+                RANGE_QUERY.format(table=table), bounds[table]
+            ).fetchall()
+            seconds.append(time.perf_counter() - start)
+            rows.append(len(result))
+    return {
+        table: dict(summarize(seconds), mean_rows=round(float(np.mean(rows)), 1))
+        for table, (seconds, rows) in timings.items()
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the date parsing and date range queries"
+    )
+    parser.add_argument("--headers", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--locations", type=int, default=4000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {"headers": time_headers(args.headers, args.repeat)}
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.closing(sqlite3.connect(f"{directory}/dates.db")) as conn:
+            build_tables(conn, args.locations, args.days, args.seed)
+            results["range_queries"] = time_ranges(
+                conn, args.days, args.queries, args.seed
+            )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,145 @@
+"""Latency benchmark of the map viewport queries
+
+Builds a synthetic covid_master.db, then times random viewports two ways:
+the geo grid cells in view (geogrid.pick_zoom() and geogrid.cells_query()),
+and the full log_lat_overall scan the map used before the grid, filtered to the viewport afterwards.
+The full scan takes seconds per viewport on large databases, so only the first --scan-queries viewports are scanned.
+
+    python dashboards/bench_geo_grid.py --locations 4000 --days 365 --queries 200 --scan-queries 20
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geogrid
+from synthetic import build_covid_db
+
+
+def random_locations(n_locations, seed=0):
+    """Random locations of 200 countries, one state each
+
+    Returns:
+        pd.DataFrame: location columns, one row per location
+    """
+
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame(
+        {
+            "country": [f"C{i % 200}" for i in range(n_locations)],
+            "state": [f"S{i}" for i in range(n_locations)],
+            "latitude": rng.uniform(-60, 70, n_locations).round(4),
+            "longitude": rng.uniform(-180, 180, n_locations).round(4),
+        }
+    )
+
+
+def random_viewports(n, seed=0):
+    """Viewports from the whole world down to a few degrees, some crossing the antimeridian
+
+    Returns:
+        list: (south, west, north, east) tuples
+    """
+
+    rng = np.random.RandomState(seed)
+    viewports = []
+    for _ in range(n):
+        height = 180 / 2 ** rng.randint(0, 6)
+        south = rng.uniform(-90, 90 - height)
+        west = rng.uniform(-180, 180)
+        east = (west + 2 * height + 180) % 360 - 180
+        viewports.append((south, west, south + height, east))
+    return viewports
+
+
+def in_view(df, bbox):
+    south, west, north, east = bbox
+    lat = df["latitude"].between(south, north)
+    if west <= east:
+        return df[lat & df["longitude"].between(west, east)]
+    return df[lat & ((df["longitude"] >= west) | (df["longitude"] <= east))]
+
+
+def summarize(seconds, rows):
+    ms = np.asarray(seconds) * 1000
+    p50, p95 = np.percentile(ms, [50, 95])
+    return {
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "max_ms": round(ms.max(), 2),
+        "mean_rows": round(float(np.mean(rows)), 1),
+    }
+
+
+def run_benchmark(conn, viewports, scan_queries=None, max_cells=2000):
+    """Times every viewport with the grid, and the first ones with the full scan
+
+    Args:
+        conn (sqlite3.Connection): connection to the benchmark database
+        viewports (list): (south, west, north, east) tuples from random_viewports()
+        scan_queries (int, optional): number of viewports timed with the full scan. Defaults to None, all of them.
+        max_cells (int, optional): cell budget of geogrid.pick_zoom(). Defaults to 2000.
+
+    Returns:
+        dictionary: latency percentiles and rows returned of both approaches
+    """
+
+    zoom_levels = dict(
+        conn.execute(
+            "SELECT zoom, MAX(lat_max - lat_min) FROM geo_grid GROUP BY zoom"
+        ).fetchall()
+    )
+    timings = {"geo_grid": ([], []), "full_scan": ([], [])}
+    for i, bbox in enumerate(viewports):
+        start = time.perf_counter()
+        zoom = geogrid.pick_zoom(bbox, zoom_levels, max_cells)
+        df = pd.read_sql_query(geogrid.cells_query(zoom, bbox), conn)
+        timings["geo_grid"][0].append(time.perf_counter() - start)
+        timings["geo_grid"][1].append(len(df))
+        if scan_queries is not None and i >= scan_queries:
+            continue
+
+        start = time.perf_counter()
+        df = pd.read_sql_query(
+            "SELECT latitude, longitude, confirmed FROM log_lat_overall", conn
+        )
+        df = in_view(df, bbox)
+        timings["full_scan"][0].append(time.perf_counter() - start)
+        timings["full_scan"][1].append(len(df))
+    return {name: summarize(*values) for name, values in timings.items()}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the map viewport queries")
+    parser.add_argument("--locations", type=int, default=4000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--scan-queries",
+        type=int,
+        default=20,
+        help="viewports also timed with the full scan, which is much slower",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        build_covid_db(
+            directory, random_locations(args.locations, args.seed), args.days, args.seed
+        )
+        conn = sqlite3.connect(f"{directory}/covid_master.db")
+        results = run_benchmark(
+            conn, random_viewports(args.queries, args.seed), args.scan_queries
+        )
+        conn.close()
+    print(json.dumps(results, indent=2))
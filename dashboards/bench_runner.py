@@ -0,0 +1,196 @@
+"""Wall time of the covid pipeline, sequential against PipelinedRunner, on throttled sources
+
+Writes synthetic JHU sources (synthetic.synthetic_sources()) and serves them from a local HTTP server
+which throttles every download to --mbps after --latency-ms, as a stand-in for the JHU repository.
+Then runs CovidPipeline.run_pipeline() and PipelinedRunner.run_pipeline() against it, each into its own database,
+timing every download, transform, staging insert (to_sql) and publish step of both runs.
+The runner only overlaps the downloads and transforms: the staging inserts run on the event loop thread,
+and the geo grid, indexes and swap once every group is staged, so the tail after the last download stays serialized.
+
+    python dashboards/bench_runner.py --global-locations 3000 --usa-locations 3300 --days 400 --mbps 4
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.async_runner import PipelinedRunner
+from etl.constants import ETLConfigs
+from etl.covid_daily import CovidPipeline
+from etl.sources import SourceRegistry
+from synthetic import synthetic_sources
+from utils import DBUpdates
+
+CHUNK_BYTES = 64 * 1024
+# steps timed in every run, as (owner, method) where the owner is the pipeline or its database
+TIMED_STEPS = {
+    "download": ("pipeline", "download_to_df"),
+    "transform": ("pipeline", "transform_source"),
+    "insert_to_table": ("database", "insert_to_table"),
+    "build_geo_grid": ("database", "build_geo_grid"),
+    "create_staging_indexes": ("database", "create_staging_indexes"),
+    "publish": ("database", "publish"),
+}
+
+
+class ThrottledHandler(SimpleHTTPRequestHandler):
+    """Serves files after the latency of its server, at the bandwidth of its server
+    """
+
+    def copyfile(self, source, outputfile):
+        time.sleep(self.server.latency)
+        while True:
+            chunk = source.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            time.sleep(len(chunk) / self.server.bytes_per_second)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, mbps, latency_ms):
+    """Serves the csv files of a directory on a free port, throttled
+
+    Returns:
+        ThreadingHTTPServer: the running server
+    """
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(ThrottledHandler, directory=directory)
+    )
+    server.bytes_per_second = mbps * 2 ** 20
+    server.latency = latency_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed_pipeline(directory, url, spans):
+    """A CovidPipeline reading the served sources, which appends (step, start, end) to spans for every timed step
+    """
+
+    os.makedirs(directory)
+    database = DBUpdates()
+    database.project_root = directory
+    sources = SourceRegistry(
+        {
+            name: dict(source, url=f"{url}/{name}.csv")
+            for name, source in ETLConfigs.SOURCES.items()
+        }
+    )
+    pipeline = CovidPipeline(database, sources=sources)
+    owners = {"pipeline": pipeline, "database": database}
+    lock = threading.Lock()
+
+    def timed(step, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with lock:
+                    spans.append((step, start, time.perf_counter()))
+
+        return wrapper
+
+    for step, (owner, method) in TIMED_STEPS.items():
+        setattr(
+            owners[owner], method, timed(step, getattr(owners[owner], method)),
+        )
+    return pipeline
+
+
+def run_timed(run, directory, url):
+    """Runs a pipeline and summarizes the time spent in each step
+
+    Args:
+        run (function): runs the pipeline it is given
+        directory (str): directory to write covid_master.db to
+        url (str): url of the served sources
+
+    Returns:
+        dictionary: wall time, time after the last download, then busy time, first start and last end of each step
+    """
+
+    spans = []
+    pipeline = timed_pipeline(directory, url, spans)
+    start = time.perf_counter()
+    run(pipeline)
+    wall = time.perf_counter() - start
+    last_download = max(end for step, _, end in spans if step == "download")
+    results = {
+        "wall_seconds": round(wall, 2),
+        "after_last_download_seconds": round(wall - (last_download - start), 2),
+    }
+    for step in TIMED_STEPS:
+        step_spans = [(s, e) for name, s, e in spans if name == step]
+        results[step] = {
+            "busy_seconds": round(sum(e - s for s, e in step_spans), 2),
+            "first_start": round(min(s for s, _ in step_spans) - start, 2),
+            "last_end": round(max(e for _, e in step_spans) - start, 2),
+        }
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipelined runner against the sequential pipeline"
+    )
+    parser.add_argument("--global-locations", type=int, default=3000)
+    parser.add_argument("--usa-locations", type=int, default=3300)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument(
+        "--mbps", type=float, default=4, help="bandwidth of every download"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=200, help="wait before every download"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources_dir = os.path.join(directory, "sources")
+        os.makedirs(sources_dir)
+        sources = synthetic_sources(
+            args.global_locations, args.usa_locations, args.days, args.seed
+        )
+        for name, df in sources.items():
+            df.to_csv(os.path.join(sources_dir, f"{name}.csv"), index=False)
+        server = serve(sources_dir, args.mbps, args.latency_ms)
+        url = "http://127.0.0.1:{}".format(server.server_port)
+        try:
+            results = {
+                "source_mb": round(
+                    sum(
+                        os.path.getsize(os.path.join(sources_dir, f))
+                        for f in os.listdir(sources_dir)
+                    )
+                    / 2 ** 20,
+                    1,
+                ),
+                "sequential": run_timed(
+                    lambda pipeline: pipeline.run_pipeline(),
+                    os.path.join(directory, "sequential"),
+                    url,
+                ),
+                "pipelined": run_timed(
+                    lambda pipeline: PipelinedRunner(pipeline).run_pipeline(),
+                    os.path.join(directory, "pipelined"),
+                    url,
+                ),
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,78 @@
+"""Memory and time of the covid transform, quality checks included
+
+Builds the wide JHU sources in memory (synthetic.synthetic_sources()), then runs CovidPipeline.transform() under tracemalloc.
+The quality checks run on the wide sources and the arrays the transform already computes,
+so the peak should stay a small multiple of the payload, whatever the number of findings.
+
+    python dashboards/bench_transform.py --global-locations 3000 --usa-locations 3300 --days 400 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.covid_daily import CovidPipeline
+from etl.quality import resolve_country
+from synthetic import synthetic_sources
+
+
+def run_transform(sources):
+    """Transforms the sources once, with a cold country lookup cache as on a fresh run
+
+    Returns:
+        tuple: the pipeline, seconds and peak traced bytes of the transform
+    """
+
+    resolve_country.cache_clear()
+    pipeline = CovidPipeline()
+    for name, df in sources.items():
+        # the transform drops and renames columns in place
+        setattr(pipeline, f"df_{name}", df.copy())
+    tracemalloc.start()
+    start = time.perf_counter()
+    pipeline.transform()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pipeline, seconds, peak
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memory of the covid transform"
+    )
+    parser.add_argument("--global-locations", type=int, default=3000)
+    parser.add_argument("--usa-locations", type=int, default=3300)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sources = synthetic_sources(
+        args.global_locations, args.usa_locations, args.days, args.seed
+    )
+    runs = [run_transform(sources) for _ in range(args.repeat)]
+    pipeline = runs[-1][0]
+    body_bytes = pipeline.body.memory_usage(deep=False).sum()
+    peak = max(peak for _, _, peak in runs)
+    report = pipeline.quality.report(pipeline.load_time)
+    results = {
+        "rows": len(pipeline.body),
+        "best_seconds": round(min(seconds for _, seconds, _ in runs), 3),
+        "body_mb": round(body_bytes / 2 ** 20, 1),
+        "peak_mb": round(peak / 2 ** 20, 1),
+        "peak_over_body": round(peak / body_bytes, 2),
+        "findings": {
+            f"{source}.{check}": int(count)
+            for source, check, count in report[
+                ["source", "check_name", "count"]
+            ].itertuples(index=False)
+        },
+    }
+    print(json.dumps(results, indent=2))
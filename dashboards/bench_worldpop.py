@@ -0,0 +1,93 @@
+"""Timing of the world population table scraping
+
+Parses a saved Worldometer page two ways: WorldPopPipepine.parse_table(),
+and the BeautifulSoup path it replaced, which serialized every table back to html for pd.read_html() and then replaced 'N.A.'.
+The saved page of the tests only lists a few countries, its rows are repeated up to --rows, the live page has 235.
+
+    python dashboards/bench_worldpop.py --rows 235 --repeat 50
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.worldpop import WorldPopPipepine
+
+PAGE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "tests",
+    "fixtures",
+    "worldometer_population.html",
+)
+
+
+def grow_page(content, n_rows):
+    """Repeats the table rows of the page until it holds n_rows
+
+    Args:
+        content (bytes): html of the saved page
+        n_rows (int): number of table rows
+
+    Returns:
+        bytes: html of the grown page
+    """
+
+    head, rest = content.split(b"<tbody>", 1)
+    body, tail = rest.split(b"</tbody>", 1)
+    rows = re.findall(rb"<tr>.*?</tr>", body, flags=re.S)
+    grown = [rows[i % len(rows)] for i in range(n_rows)]
+    return head + b"<tbody>\n" + b"\n".join(grown) + b"\n</tbody>" + tail
+
+
+def parse_soup(content):
+    """The scraping of the population table before parse_table()
+    """
+
+    data = BeautifulSoup(content, features="lxml").find_all("table")
+    df = pd.read_html(io.StringIO(str(data)))[0]
+    return df.replace({"N.A.": np.nan})
+
+
+def time_parser(parse, content, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = parse(content)
+        seconds.append(time.perf_counter() - start)
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.median(ms)), 2),
+        "min_ms": round(float(ms.min()), 2),
+        "rows": len(df),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the world population table scraping"
+    )
+    parser.add_argument("--page", default=PAGE)
+    parser.add_argument("--rows", type=int, default=235)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.page, "rb") as f:
+        content = grow_page(f.read(), args.rows)
+    results = {
+        "bs4_read_html": time_parser(parse_soup, content, args.repeat),
+        "parse_table": time_parser(
+            WorldPopPipepine(worldpopdb=object()).parse_table, content, args.repeat
+        ),
+    }
+    print(json.dumps(results, indent=2))
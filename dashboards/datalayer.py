@@ -0,0 +1,306 @@
+import sqlite3
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import pycountry
+import pycountry_convert as pc
+
+from plotly.subplots import make_subplots
+
+import geogrid
+import instrumentation
+import result_cache
+from dataversion import data_version, db_dir
+
+
+# ------------------------------------------------------------------ #
+# --------------------- Sec.0 Helper functions --------------------- #
+# ------------------------------------------------------------------ #
+
+
+# results shared by every dashboard process, only when DASHBOARD_CACHE_DIR is set
+shared_cache = result_cache.from_env(version=data_version)
+
+
+@instrumentation.cached("query_to_df", backend=shared_cache, allow_output_mutation=True)
+def query_to_df(database=None, query=None):
+    """Create a database connection to the SQLite database specified by the db_file.
+
+    Arguments:
+        db_file {string} -- name of database file
+    Returns:
+        DataFrame -- Contents of the sql query
+    """
+
+    conn = None
+    try:
+        conn = sqlite3.connect(f"{db_dir()}/{database}.db")
+    except sqlite3.Error as e:
+        print(e)
+    df = pd.read_sql_query(query, conn)
+    conn.close()
+
+    return df
+
+
+@instrumentation.cached(
+    "create_country_iso_dict", backend=shared_cache, allow_output_mutation=True
+)
+def create_country_iso_dict(df, iso):
+    """Returns a ISO 3166-1 alpha-2 code for each countries based on the country name
+
+    Args:
+        df (DataFrame): data that contains a column of country names
+
+    Returns:
+        dictionary: dictionary takes country name as key, and iso code as value
+    """
+
+    c_list = df["country"].unique().tolist()
+    country_iso_dict = {}
+    for country in c_list:
+        try:
+            if iso == "iso2":
+                iso_code = pycountry.countries.search_fuzzy(country)[0].alpha_2
+            elif iso == "iso3":
+                iso_code = pycountry.countries.search_fuzzy(country)[0].alpha_3
+        except:
+            iso_code = "N/A"
+        country_iso_dict[country] = iso_code
+    return country_iso_dict
+
+
+@instrumentation.cached("grid_zoom_levels", backend=shared_cache)
+def grid_zoom_levels():
+    """Get the zoom levels available in the geo grid, and their cell size
+
+    Returns:
+        dictionary: zoom level as key, cell size in degrees as value
+    """
+
+    df = query_to_df(
+        database="covid_master",
+        query="SELECT zoom, MAX(lat_max - lat_min) AS cell_degrees FROM geo_grid GROUP BY zoom",
+    )
+    return dict(zip(df["zoom"], df["cell_degrees"]))
+
+
+def zoom_for_bbox(bbox, max_cells=2000):
+    """Pick the finest grid zoom level that keeps the viewport under a number of cells, see geogrid.pick_zoom()
+
+    Args:
+        bbox (tuple): viewport as (south, west, north, east) in degrees
+        max_cells (int, optional): upper bound of cells to render. Defaults to 2000.
+
+    Returns:
+        int: zoom level to pass to query_grid_cells()
+    """
+
+    return geogrid.pick_zoom(bbox, grid_zoom_levels(), max_cells)
+
+
+@instrumentation.timed("query_grid_cells")
+def query_grid_cells(zoom, bbox=(-90, -180, 90, 180)):
+    """Get the aggregated grid cells of a zoom level which intersect the viewport, see geogrid.cells_query()
+
+    Args:
+        zoom (int): grid zoom level, see zoom_for_bbox()
+        bbox (tuple, optional): viewport as (south, west, north, east) in degrees. Defaults to the whole world.
+
+    Returns:
+        DataFrame: cell centroids with the number of locations, confirmed and deaths
+    """
+
+    return query_to_df(database="covid_master", query=geogrid.cells_query(zoom, bbox))
+
+
+def ordinal_to_datetime(days):
+    """Converts the integer day ordinals stored in the database into datetimes for display
+
+    Args:
+        days (Series or int): days since 1970-01-01
+
+    Returns:
+        Series or Timestamp: the matching dates
+    """
+
+    return pd.to_datetime(days, unit="D")
+
+
+@instrumentation.cached("create_continent_dict", backend=shared_cache)
+def create_continent_dict(dict):
+
+    continent_dict = {}
+    codename = {
+        "AS": "Asia",
+        "EU": "Europe",
+        "AF": "Africa",
+        "NA": "North America",
+        "SA": "South America",
+        "OC": "Oceania",
+    }
+    for key, value in dict.items():
+        try:
+            continent = codename[pc.country_alpha2_to_continent_code(value)]
+        except:
+            continent = "N/A"
+        continent_dict[key] = continent
+    return continent_dict
+
+
+# ------------------------------------------------------------------------------ #
+# --------------------- Sec.1 Loading data into DataFrames --------------------- #
+# ------------------------------------------------------------------------------ #
+
+
+def load_dashboard_data():
+    """Loads the DataFrames every page of the dashboard starts from
+
+    Returns:
+        dictionary: DataFrame name as key, cached DataFrame as value
+    """
+
+    world_bbox = (-90, -180, 90, 180)
+    return {
+        "country_overall": query_to_df(
+            database="covid_master", query="SELECT * FROM country_overall"
+        ),
+        "country_daily": query_to_df(
+            database="covid_master", query="SELECT * FROM country_daily"
+        ),
+        "state_daily": query_to_df(
+            database="covid_master",
+            query="SELECT * FROM state_daily WHERE state IS NOT NULL",
+        ),
+        "coordinates_overall": query_grid_cells(zoom_for_bbox(world_bbox), world_bbox),
+        "daily_overall": query_to_df(
+            database="covid_master",
+            query="""
+    SELECT date, sum(confirmed) confirmed, sum(death) death
+    FROM country_daily
+    GROUP BY date
+    """,
+        ),
+        "world_population": query_to_df(
+            database="population", query="SELECT * FROM world_population"
+        ),
+    }
+
+
+@instrumentation.timed("select_daily")
+def select_daily(data, country=None, state=None):
+    """Selects the daily figures shown for a sidebar selection
+
+    Args:
+        data (dictionary): DataFrames from load_dashboard_data()
+        country (string, optional): selected country, the global figures when None. Defaults to None.
+        state (string, optional): selected state of the country. Defaults to None.
+
+    Returns:
+        DataFrame: daily confirmed and death of the selection
+    """
+
+    if country is None:
+        df = data["daily_overall"]
+        df["country"] = "Global"
+    elif state is None:
+        df = data["country_daily"][data["country_daily"]["country"] == country]
+    else:
+        df = data["state_daily"][data["state_daily"]["state"] == state]
+    return df
+
+
+# --------------------------------------------------------- #
+# --------------------- Sec.2 Figures --------------------- #
+# --------------------------------------------------------- #
+
+
+@instrumentation.timed("plot_daily")
+def plot_daily(df, metric):
+    """Plots the daily infected or death in two axis - histogram for daily, line plot for cumulative
+
+    Args:
+        df (DataFrame): contains the data to plot, requires column for data and metric
+        metric (string): label of the column to plot. needs to exist in df
+
+    Returns:
+        plotly figure: the figure, ready for st.plotly_chart()
+    """
+
+    renames = {"confirmed": "Infections", "death": "Deaths"}
+    label = renames[metric]
+    df["csum"] = df[metric].cumsum()
+    dates = ordinal_to_datetime(df["date"])
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Bar(name="Daily", x=dates, y=df[metric]), secondary_y=False)
+    fig.add_trace(
+        go.Scatter(name="Running Total", x=dates, y=df["csum"]), secondary_y=True,
+    )
+    fig.update_layout(
+        title_text=f"<b>{label} over time</b>".upper(),
+        legend_orientation="h",
+        width=800,
+        height=500,
+    )
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text=f"Daily {label}", secondary_y=False)
+    fig.update_yaxes(title_text=f"Total {label}", secondary_y=True)
+    return fig
+
+
+@instrumentation.timed("plot_fatality")
+def plot_fatality(fig, df, state=False):
+    """Plots the fatality over infected cases ratios over time
+
+    Args:
+        fig (plotly figure): plotly figure to chart the data onto
+        df (DataFrame): data containing both infected and death cases over time
+        state (bool, optional): flag for whether to chart based on state or country. Defaults to False.
+    """
+
+    if state == False:
+        line_label = df["country"].iloc[0]
+    else:
+        line_label = df["state"].iloc[0]
+    df["csum_death"] = df["death"].cumsum()
+    df["csum_confirmed"] = df["confirmed"].cumsum()
+    df["case_fatality_ratio"] = df["csum_death"] / df["csum_confirmed"] * 1000
+    fig.add_trace(
+        go.Scatter(
+            x=ordinal_to_datetime(df["date"]),
+            y=df["case_fatality_ratio"],
+            mode="lines",
+            name=line_label,
+        )
+    )
+    fig.update_layout(
+        title_text=f"<b>Deaths per 1000 Infections</b>".upper(),
+        legend_orientation="h",
+        width=750,
+        height=500,
+    )
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text=f"Fatality Rate")
+
+
+# TODO: chroploth map - add over time filters or animation
+
+
+@instrumentation.cached("plot_cholopleth", backend=shared_cache)
+def plot_cholopleth(df, iso2_dict, iso3_dict, continent_dict):
+
+    df["iso2"] = df["country"].map(iso2_dict)
+    df["iso3"] = df["country"].map(iso3_dict)
+    df["continent"] = df["country"].map(continent_dict)
+    df["date_formatted"] = ordinal_to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+    cholo_fig = px.choropleth(
+        df,
+        locations="iso3",
+        color="confirmed",
+        hover_name="country",
+        color_continuous_scale=px.colors.sequential.matter,
+        animation_frame="date_formatted",
+    )
+
+    return cholo_fig
@@ -0,0 +1,44 @@
+"""Location and version of the databases read by the dashboards
+
+Kept apart from datalayer.py, which caches its functions with streamlit, so the version keying the shared cache can be tested on its own
+"""
+
+import os
+import sqlite3
+
+# directory holding covid_master.db and population.db, the working directory unless set
+DB_DIR_ENV = "DASHBOARD_DB_DIR"
+DATABASES = ["covid_master", "population"]
+
+
+def db_dir():
+    """Get the directory of the SQLite databases
+
+    Returns:
+        string: DASHBOARD_DB_DIR if set, the working directory otherwise
+    """
+
+    return os.environ.get(DB_DIR_ENV) or os.path.abspath(os.curdir)
+
+
+def data_version():
+    """Get the version of the data, which changes whenever a pipeline publishes.
+    Publishing and revising both swap or create tables, which bumps the schema version of the database,
+    while readers opening and closing connections leave it as is, unlike the write-ahead log file
+
+    Returns:
+        tuple: schema version of each database, None when it does not exist
+    """
+
+    version = []
+    for database in DATABASES:
+        try:
+            conn = sqlite3.connect(f"file:{db_dir()}/{database}.db?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            version.append(None)
+            continue
+        try:
+            version.append(conn.execute("PRAGMA schema_version").fetchone()[0])
+        finally:
+            conn.close()
+    return tuple(version)
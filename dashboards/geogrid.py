@@ -0,0 +1,52 @@
+"""Viewport queries of the geo grid built by the covid pipeline (see sql/build_geo_grid.sql)
+
+Kept apart from datalayer.py, which caches them with streamlit, so they can be tested and benchmarked on their own
+"""
+
+
+def pick_zoom(bbox, zoom_levels, max_cells=2000):
+    """Pick the finest grid zoom level that keeps the viewport under a number of cells
+
+    Args:
+        bbox (tuple): viewport as (south, west, north, east) in degrees
+        zoom_levels (dictionary): zoom level as key, cell size in degrees as value
+        max_cells (int, optional): upper bound of cells to render. Defaults to 2000.
+
+    Returns:
+        int: zoom level to pass to cells_query()
+    """
+
+    south, west, north, east = bbox
+    lon_span = east - west if west <= east else 360 - (west - east)
+    zoom = min(zoom_levels)
+    for level, cell_degrees in sorted(zoom_levels.items()):
+        n_cells = ((north - south) / cell_degrees + 1) * (lon_span / cell_degrees + 1)
+        if n_cells <= max_cells:
+            zoom = level
+    return zoom
+
+
+def cells_query(zoom, bbox=(-90, -180, 90, 180)):
+    """Build the query of the grid cells of a zoom level which intersect the viewport.
+    A viewport with west > east crosses the antimeridian.
+
+    Args:
+        zoom (int): grid zoom level, see pick_zoom()
+        bbox (tuple, optional): viewport as (south, west, north, east) in degrees. Defaults to the whole world.
+
+    Returns:
+        string: SQL query of the cell centroids with the number of locations, confirmed and deaths
+    """
+
+    south, west, north, east = (float(b) for b in bbox)
+    if west <= east:
+        lon_filter = f"lon_max >= {west} AND lon_min <= {east}"
+    else:
+        lon_filter = f"(lon_max >= {west} OR lon_min <= {east})"
+    return f"""
+    SELECT latitude, longitude, locations, confirmed, death
+    FROM geo_grid
+    WHERE zoom = {int(zoom)}
+      AND lat_min <= {north} AND lat_max >= {south}
+      AND {lon_filter}
+    """
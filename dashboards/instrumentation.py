@@ -0,0 +1,429 @@
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import streamlit as st
+
+# Instrumentation is off unless one of these is set, the decorators then only apply st.cache
+DEBUG_ENV = "DASHBOARD_DEBUG"
+METRICS_PORT_ENV = "DASHBOARD_METRICS_PORT"
+METRICS_HOST = "127.0.0.1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1e4, 1e5, 1e6, 1e7, 1e8)
+SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def debug_enabled():
+    """Whether the hidden debug panel is requested
+
+    Returns:
+        bool: True if DASHBOARD_DEBUG is set to a non empty value other than 0
+    """
+
+    return os.environ.get(DEBUG_ENV, "0") not in ("", "0")
+
+
+def metrics_port():
+    """Port of the metrics endpoint
+
+    Returns:
+        int: port from DASHBOARD_METRICS_PORT, None when not set
+    """
+
+    port = os.environ.get(METRICS_PORT_ENV)
+    return int(port) if port else None
+
+
+def enabled():
+    """Whether the dashboard functions are instrumented
+
+    Returns:
+        bool: True if either the debug panel or the metrics endpoint is requested
+    """
+
+    return debug_enabled() or metrics_port() is not None
+
+
+class Histogram:
+    """ Class for a cumulative histogram in the Prometheus sense
+    """
+
+    def __init__(self, buckets):
+        """
+        Args:
+            buckets (tuple): upper bounds of the buckets, ascending
+        """
+
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Adds one observation
+
+        Args:
+            value (float): observed value
+        """
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """ Class for holding the metrics of every instrumented function of the dashboard
+
+    Payload and interface
+    ---------------------
+    Per function: a latency histogram, cache hit / miss / eviction counters, rows and bytes of the DataFrames returned,
+    and a size histogram of the figures rendered.
+    Streamlit reruns the app script on every interaction, but this module is only imported once per server,
+    so the registry accumulates over every session.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.figure_bytes = {}
+        self.counters = {}
+        self.seen_keys = {}
+        self.local = threading.local()
+        self.result_caches = []
+
+    def increment(self, name, function, value=1):
+        """Adds to a counter
+
+        Args:
+            name (str): counter name, e.g. cache_hits
+            function (str): name of the instrumented function
+            value (int, optional): amount to add. Defaults to 1.
+        """
+
+        with self.lock:
+            key = (name, function)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe_latency(self, function, seconds):
+        """Adds a call duration to the latency histogram of a function
+        """
+
+        with self.lock:
+            self.latency.setdefault(function, Histogram(LATENCY_BUCKETS)).observe(
+                seconds
+            )
+
+    def observe_figure(self, function, size):
+        """Adds a figure JSON size to the figure histogram of a function
+        """
+
+        with self.lock:
+            self.figure_bytes.setdefault(function, Histogram(SIZE_BUCKETS)).observe(
+                size
+            )
+
+    def computed(self, function):
+        """Number of times the body of a cached function ran in the current thread
+
+        Args:
+            function (str): name of the instrumented function
+
+        Returns:
+            int: number of executions so far
+        """
+
+        return getattr(self.local, "computed", {}).get(function, 0)
+
+    def mark_computed(self, function):
+        """Marks one execution of the body of a cached function in the current thread
+        """
+
+        if not hasattr(self.local, "computed"):
+            self.local.computed = {}
+        self.local.computed[function] = self.local.computed.get(function, 0) + 1
+
+    def record_miss(self, function, key):
+        """Counts a cache miss, and an eviction when the same simple arguments were computed before.
+        st.cache does not report evictions, so recomputing a key seen before is the estimate
+
+        Args:
+            function (str): name of the instrumented function
+            key (tuple): arguments of the call, None when they are not simple values
+        """
+
+        self.increment("cache_misses", function)
+        if key is None:
+            return
+        with self.lock:
+            seen = self.seen_keys.setdefault(function, set())
+            evicted = key in seen
+            seen.add(key)
+        if evicted:
+            self.increment("cache_evictions", function)
+
+    def record_result(self, function, result):
+        """Counts the rows and bytes of a returned DataFrame
+
+        Args:
+            function (str): name of the instrumented function
+            result (object): returned value, ignored unless it is a DataFrame
+        """
+
+        if isinstance(result, pd.DataFrame):
+            self.increment("rows_returned", function, len(result))
+            self.increment(
+                "bytes_returned",
+                function,
+                int(result.memory_usage(index=True, deep=True).sum()),
+            )
+
+    def snapshot(self):
+        """Summarizes the metrics for the debug panel
+
+        Returns:
+            DataFrame: one row per instrumented function
+        """
+
+        with self.lock:
+            functions = sorted(
+                set(self.latency)
+                | set(self.figure_bytes)
+                | {function for _, function in self.counters}
+            )
+            rows = []
+            for function in functions:
+                latency = self.latency.get(function)
+                figure = self.figure_bytes.get(function)
+                rows.append(
+                    {
+                        "function": function,
+                        "calls": latency.count if latency else 0,
+                        "mean_ms": latency.sum / latency.count * 1000
+                        if latency and latency.count
+                        else None,
+                        "total_ms": latency.sum * 1000 if latency else None,
+                        "cache_hits": self.counters.get(("cache_hits", function), 0),
+                        "cache_misses": self.counters.get(
+                            ("cache_misses", function), 0
+                        ),
+                        "cache_evictions": self.counters.get(
+                            ("cache_evictions", function), 0
+                        ),
+                        "rows": self.counters.get(("rows_returned", function), 0),
+                        "bytes": self.counters.get(("bytes_returned", function), 0),
+                        "figure_bytes": figure.sum / figure.count
+                        if figure and figure.count
+                        else None,
+                    }
+                )
+        return pd.DataFrame(rows)
+
+    def render(self):
+        """Renders the metrics in the Prometheus text exposition format
+
+        Returns:
+            str: every histogram and counter
+        """
+
+        lines = []
+        with self.lock:
+            for metric, histograms, unit in (
+                ("dashboard_function_seconds", self.latency, "seconds"),
+                ("dashboard_figure_json_bytes", self.figure_bytes, "bytes"),
+            ):
+                lines.append("# TYPE {} histogram".format(metric))
+                for function, histogram in sorted(histograms.items()):
+                    label = 'function="{}"'.format(function)
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(
+                            '{}_bucket{{{},le="{}"}} {}'.format(
+                                metric, label, bound, count
+                            )
+                        )
+                    lines.append(
+                        '{}_bucket{{{},le="+Inf"}} {}'.format(
+                            metric, label, histogram.count
+                        )
+                    )
+                    lines.append("{}_sum{{{}}} {}".format(metric, label, histogram.sum))
+                    lines.append(
+                        "{}_count{{{}}} {}".format(metric, label, histogram.count)
+                    )
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                metric = "dashboard_{}_total".format(name)
+                lines.append("# TYPE {} counter".format(metric))
+                for (counter, function), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(
+                            '{}{{function="{}"}} {}'.format(metric, function, value)
+                        )
+            # the shared result cache counts its own hits, misses and evictions
+            for cache in self.result_caches:
+                for name, value in sorted(cache.stats.items()):
+                    metric = "dashboard_result_cache_{}_total".format(name)
+                    lines.append("# TYPE {} counter".format(metric))
+                    lines.append("{} {}".format(metric, value))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def call_key(args, kwargs):
+    """Builds a hashable key from simple call arguments
+
+    Returns:
+        tuple: the arguments, None if any of them is not a simple value
+    """
+
+    values = list(args) + list(kwargs.values())
+    if not all(isinstance(value, SIMPLE_TYPES) for value in values):
+        return None
+    return tuple(args), tuple(sorted(kwargs.items()))
+
+
+def cached(name, backend=None, **cache_kwargs):
+    """Drop in for @st.cache which also times the call and counts cache hits and misses.
+    The cached body marks its execution, so a call which did not run it was served from the cache
+
+    Args:
+        name (str): name of the function in the metrics
+        backend (ResultCache, optional): shared cache consulted on a st.cache miss, before computing.
+            Defaults to None, only st.cache.
+        **cache_kwargs: passed on to st.cache
+
+    Returns:
+        function: decorator
+    """
+
+    def decorator(func):
+        if backend is not None:
+            func = backend.wrap(name, func)
+            if backend not in registry.result_caches:
+                registry.result_caches.append(backend)
+        if not enabled():
+            return st.cache(func, **cache_kwargs)
+
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            registry.mark_computed(name)
+            return func(*args, **kwargs)
+
+        cached_func = st.cache(inner, **cache_kwargs)
+
+        @functools.wraps(func)
+        def outer(*args, **kwargs):
+            before = registry.computed(name)
+            start = time.perf_counter()
+            result = cached_func(*args, **kwargs)
+            registry.observe_latency(name, time.perf_counter() - start)
+            if registry.computed(name) > before:
+                registry.record_miss(name, call_key(args, kwargs))
+            else:
+                registry.increment("cache_hits", name)
+            registry.record_result(name, result)
+            return result
+
+        return outer
+
+    return decorator
+
+
+def timed(name):
+    """Times an uncached function
+
+    Args:
+        name (str): name of the function in the metrics
+
+    Returns:
+        function: decorator
+    """
+
+    def decorator(func):
+        if not enabled():
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            registry.observe_latency(name, time.perf_counter() - start)
+            registry.record_result(name, result)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def plotly_chart(name, fig):
+    """Renders a figure with st.plotly_chart, recording the size of its JSON payload
+
+    Args:
+        name (str): name of the figure in the metrics
+        fig (plotly figure): figure to render
+    """
+
+    if enabled():
+        registry.observe_figure(name, len(fig.to_json()))
+    st.plotly_chart(fig)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Class for serving the registry at /metrics
+    """
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    """Serves /metrics on DASHBOARD_METRICS_PORT in a background thread, once per process.
+    Safe to call on every rerun of the app script
+
+    Returns:
+        ThreadingHTTPServer: the running server, None when no port is configured
+    """
+
+    global _server
+    port = metrics_port()
+    if port is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((METRICS_HOST, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def debug_panel():
+    """Shows the metrics in the sidebar, only when DASHBOARD_DEBUG is set
+    """
+
+    if not debug_enabled():
+        return
+    st.sidebar.markdown("----")
+    if st.sidebar.checkbox("Show instrumentation"):
+        st.sidebar.dataframe(registry.snapshot())
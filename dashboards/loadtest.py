@@ -0,0 +1,421 @@
+"""Load test of the dashboard data and figure code, without a browser
+
+Simulates concurrent Streamlit sessions in one process, the way `streamlit run dashboards/app.py` serves them:
+every session runs a script of page reruns on its own thread, and all of them share the st.cache memory.
+By default the data comes from a synthetic database built with a fixed seed, so runs are comparable across commits.
+
+    python dashboards/loadtest.py --sessions 40 --concurrency 8 --output loadtest.json
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pycountry
+import warnings
+from pandas.core.common import SettingWithCopyWarning
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datalayer
+import dataversion
+from etl.constants import ETLConfigs, WorldPopConfig
+from synthetic import build_covid_db
+from utils import WorldPopUpdates
+
+# the figures add their running totals to slices of the loaded data, as in app.py
+warnings.filterwarnings("ignore", category=SettingWithCopyWarning)
+
+# the app always lists these first, so the synthetic data has to contain them
+PINNED_COUNTRIES = ["Canada", "United States", "United Kingdom"]
+PAGE_CHARTS = ("daily", "fatality", "choropleth")
+# mean daily value of each synthetic measure, synthetic.DEFAULT_RATE for the ones not listed
+MEASURE_RATES = {"confirmed": 50, "death": 2, "recovered": 30}
+
+
+def build_synthetic_db(
+    directory, n_countries=60, n_state_countries=5, n_states=30, n_days=120, seed=0
+):
+    """Writes covid_master.db and population.db with the same schema, grid and views as the pipelines
+
+    Args:
+        directory (str): directory to write the databases to
+        n_countries (int, optional): number of countries. Defaults to 60.
+        n_state_countries (int, optional): number of countries broken down by state. Defaults to 5.
+        n_states (int, optional): number of states of each of these countries. Defaults to 30.
+        n_days (int, optional): number of days of data. Defaults to 120.
+        seed (int, optional): random seed. Defaults to 0.
+    """
+
+    rng = np.random.RandomState(seed)
+    names = [c.name for c in pycountry.countries if c.name not in PINNED_COUNTRIES]
+    countries = PINNED_COUNTRIES + names[: n_countries - len(PINNED_COUNTRIES)]
+
+    locations = []
+    for i, country in enumerate(countries):
+        states = (
+            [f"{country} {s}" for s in range(n_states)]
+            if i < n_state_countries
+            else [None]
+        )
+        for state in states:
+            locations.append(
+                (country, state, rng.uniform(-60, 70), rng.uniform(-180, 180))
+            )
+    locations = pd.DataFrame(locations, columns=ETLConfigs.LOCATION_COLUMNS)
+
+    build_covid_db(directory, locations, n_days, seed, MEASURE_RATES)
+
+    population = pd.DataFrame(
+        {"id": np.arange(1, len(countries) + 1), "country": countries}
+    )
+    for column, dtype in WorldPopConfig.SQL_DTYPES.items():
+        if column not in population:
+            values = rng.uniform(0, 1000, len(countries))
+            population[column] = values.round() if dtype == "INTEGER" else values
+    worldpop = WorldPopUpdates()
+    worldpop.project_root = directory
+    with worldpop:
+        worldpop.drop_staging_table()
+        worldpop.create_insert_table(population)
+        worldpop.swap_tables()
+
+
+def page(country=None, state=None, charts=PAGE_CHARTS):
+    """A page rerun, as triggered by a sidebar interaction
+
+    Returns:
+        dictionary: selection and the charts rendered
+    """
+
+    return {"country": country, "state": state, "charts": charts}
+
+
+def global_view(data, rng):
+    """Opens the dashboard on the global figures
+    """
+
+    return [page()]
+
+
+def country_switch(data, rng):
+    """Switches between three countries
+    """
+
+    countries = data["country_overall"]["country"].to_numpy()
+    return [page(country=c) for c in rng.choice(countries, 3, replace=False)]
+
+
+def state_breakdown(data, rng):
+    """Selects a country with state data, then one of its states
+    """
+
+    state_daily = data["state_daily"]
+    country = rng.choice(state_daily["country"].unique())
+    states = state_daily.loc[state_daily["country"] == country, "state"].unique()
+    return [page(country=country), page(country=country, state=rng.choice(states))]
+
+
+def choropleth(data, rng):
+    """Reruns while interacting with the world map only
+    """
+
+    return [page(charts=("choropleth",))]
+
+
+SESSION_SCRIPTS = {
+    "global_view": global_view,
+    "country_switch": country_switch,
+    "state_breakdown": state_breakdown,
+    "choropleth": choropleth,
+}
+
+
+@contextlib.contextmanager
+def timed_path(timings, path):
+    """Appends the duration of the block to the timings of a code path
+    """
+
+    start = time.perf_counter()
+    yield
+    timings.append((path, time.perf_counter() - start))
+
+
+def render_page(view, timings):
+    """Runs the data and figure code of one rerun of app.py, serializing the figures as st.plotly_chart does
+
+    Args:
+        view (dictionary): rerun from page()
+        timings (list): (code path, seconds) of the rerun are appended to it
+    """
+
+    with timed_path(timings, "load_dashboard_data"):
+        data = datalayer.load_dashboard_data()
+    with timed_path(timings, "select_daily"):
+        df = datalayer.select_daily(data, view["country"], view["state"])
+        totals = df["confirmed"].sum(), df["death"].sum()
+    with timed_path(timings, "create_country_iso_dict"):
+        iso2_dict = datalayer.create_country_iso_dict(data["country_overall"], "iso2")
+        iso3_dict = datalayer.create_country_iso_dict(data["country_overall"], "iso3")
+    with timed_path(timings, "create_continent_dict"):
+        continent_dict = datalayer.create_continent_dict(iso2_dict)
+
+    if "daily" in view["charts"]:
+        for metric in ("confirmed", "death"):
+            with timed_path(timings, "plot_daily"):
+                fig = datalayer.plot_daily(df, metric)
+            with timed_path(timings, "serialize_daily"):
+                fig.to_json()
+    if "fatality" in view["charts"]:
+        with timed_path(timings, "plot_fatality"):
+            fig = go.Figure()
+            datalayer.plot_fatality(fig, data["daily_overall"])
+            if view["country"] is not None:
+                datalayer.plot_fatality(fig, df, state=view["state"] is not None)
+        with timed_path(timings, "serialize_fatality"):
+            fig.to_json()
+    if "choropleth" in view["charts"]:
+        with timed_path(timings, "plot_cholopleth"):
+            fig = datalayer.plot_cholopleth(
+                data["country_daily"], iso2_dict, iso3_dict, continent_dict
+            )
+            fig.update_layout(width=750, height=520, margin={"r": 1, "l": 1, "b": 0})
+        with timed_path(timings, "serialize_cholopleth"):
+            fig.to_json()
+
+
+def run_session(script, seed):
+    """Runs one session script
+
+    Args:
+        script (str): key of SESSION_SCRIPTS
+        seed (int): seed of the selections made by the session
+
+    Returns:
+        dictionary: script name, duration of every rerun and timings of every code path
+    """
+
+    rng = np.random.RandomState(seed)
+    views = SESSION_SCRIPTS[script](datalayer.load_dashboard_data(), rng)
+    reruns, timings = [], []
+    for view in views:
+        start = time.perf_counter()
+        render_page(view, timings)
+        reruns.append(time.perf_counter() - start)
+    return {"script": script, "reruns": reruns, "timings": timings}
+
+
+def rss_mb():
+    """Resident set size of the process
+
+    Returns:
+        float: current RSS in MB, peak RSS where /proc is not available
+    """
+
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def git_commit():
+    """Commit of the working tree, so results can be compared across commits
+
+    Returns:
+        dictionary: commit hash and whether the tree has uncommitted changes, None values outside a git checkout
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=root, universal_newlines=True
+        ).strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root,
+            universal_newlines=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def percentiles(seconds):
+    """Summarizes durations
+
+    Args:
+        seconds (list): durations in seconds
+
+    Returns:
+        dictionary: count, p50, p95, p99 and max in milliseconds
+    """
+
+    ms = np.asarray(seconds) * 1000
+    if not len(ms):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(ms),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(ms.max(), 2),
+    }
+
+
+def run_load_test(sessions, concurrency, scripts, warmup=True, seed=0):
+    """Runs the sessions on a thread pool and summarizes them
+
+    Args:
+        sessions (int): number of measured sessions, spread evenly over the scripts
+        concurrency (int): number of sessions running at once
+        scripts (list): keys of SESSION_SCRIPTS to run
+        warmup (bool, optional): run every script once before measuring, so the results are warm cache numbers.
+            Defaults to True.
+        seed (int, optional): seed of the session selections. Defaults to 0.
+
+    Returns:
+        dictionary: throughput, latency percentiles, RSS growth and the slowest code paths
+    """
+
+    if warmup:
+        for script in scripts:
+            run_session(script, seed)
+
+    plan = [(scripts[i % len(scripts)], seed + i) for i in range(sessions)]
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda args: run_session(*args), plan))
+    duration = time.perf_counter() - start
+    rss_end = rss_mb()
+
+    reruns = [r for result in results for r in result["reruns"]]
+    paths = {}
+    for result in results:
+        for path, seconds in result["timings"]:
+            paths.setdefault(path, []).append(seconds)
+    slowest = sorted(paths.items(), key=lambda item: sum(item[1]), reverse=True)
+    return {
+        "sessions": sessions,
+        "reruns": len(reruns),
+        "duration_seconds": round(duration, 3),
+        "sessions_per_second": round(sessions / duration, 3),
+        "reruns_per_second": round(len(reruns) / duration, 3),
+        "rerun_latency": percentiles(reruns),
+        "by_script": {
+            script: percentiles(
+                [
+                    r
+                    for result in results
+                    if result["script"] == script
+                    for r in result["reruns"]
+                ]
+            )
+            for script in scripts
+        },
+        "rss_mb": {
+            "start": round(rss_start, 1),
+            "end": round(rss_end, 1),
+            "growth_per_session_kb": round((rss_end - rss_start) * 1024 / sessions, 1),
+        },
+        "slowest_paths": [
+            dict(
+                path=path,
+                total_ms=round(sum(seconds) * 1000, 1),
+                **percentiles(seconds),
+            )
+            for path, seconds in slowest
+        ],
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Load test the dashboard data and figure code"
+    )
+    parser.add_argument(
+        "--sessions", type=int, default=40, help="number of measured sessions"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="sessions running at once"
+    )
+    parser.add_argument(
+        "--scripts",
+        nargs="+",
+        default=list(SESSION_SCRIPTS),
+        choices=list(SESSION_SCRIPTS),
+        help="session scripts to run, round robin",
+    )
+    parser.add_argument(
+        "--cold", action="store_true", help="measure without warming the cache first"
+    )
+    parser.add_argument(
+        "--db-dir",
+        help="run against the databases in this directory instead of a synthetic one",
+    )
+    parser.add_argument(
+        "--countries", type=int, default=60, help="countries in the synthetic database"
+    )
+    parser.add_argument(
+        "--days", type=int, default=120, help="days in the synthetic database"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the synthetic data and sessions"
+    )
+    parser.add_argument("--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.db_dir:
+            os.environ[dataversion.DB_DIR_ENV] = os.path.abspath(args.db_dir)
+        else:
+            build_synthetic_db(
+                directory, n_countries=args.countries, n_days=args.days, seed=args.seed
+            )
+            os.environ[dataversion.DB_DIR_ENV] = directory
+
+        results = run_load_test(
+            args.sessions,
+            args.concurrency,
+            args.scripts,
+            warmup=not args.cold,
+            seed=args.seed,
+        )
+
+    report = {
+        **git_commit(),
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "scripts": args.scripts,
+            "warmup": not args.cold,
+            "database": args.db_dir or "synthetic",
+            "countries": args.countries,
+            "days": args.days,
+            "seed": args.seed,
+        },
+        **results,
+    }
+    output = json.dumps(report, indent=2, default=float)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
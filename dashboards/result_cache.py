@@ -0,0 +1,321 @@
+import fcntl
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+import pandas as pd
+import plotly.io as pio
+from plotly.basedatatypes import BaseFigure
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+# The shared cache is off unless a directory is set, every process then only has its st.cache memory
+CACHE_DIR_ENV = "DASHBOARD_CACHE_DIR"
+CACHE_MAX_MB_ENV = "DASHBOARD_CACHE_MAX_MB"
+DEFAULT_MAX_MB = 512
+
+
+def fingerprint(value, digest):
+    """Feeds a function argument into a hash, by content
+
+    Args:
+        value (object): argument of a cached call
+        digest (hashlib hash): hash to update
+    """
+
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr((list(value.columns), value.shape)).encode("utf-8"))
+        digest.update(
+            pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()
+        )
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key in sorted(value, key=repr):
+            fingerprint(key, digest)
+            fingerprint(value[key], digest)
+        digest.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"(")
+        for item in value:
+            fingerprint(item, digest)
+        digest.update(b")")
+    elif isinstance(value, (str, int, float, bool, type(None))):
+        digest.update(repr(value).encode("utf-8"))
+    else:
+        digest.update(pickle.dumps(value))
+    digest.update(b",")
+
+
+class ResultCache:
+    """ Class for sharing the results of the dashboard's memoized functions between processes, through a local directory
+
+    Payload and interface
+    ---------------------
+    Results are stored one file per key, the key hashing the function name, its arguments and the data version,
+    so a new ETL publish never serves stale results.
+    DataFrames are stored as Arrow (pickle when pyarrow is not installed), plotly figures as JSON, anything else pickled.
+    Files are written to a temporary name then renamed, so readers only ever see complete results.
+    A miss takes an exclusive lock on a file of its own key before computing, so processes hitting the same cold key
+    compute it once, while cached functions calling each other never wait on a lock they already hold.
+    Once the directory grows above its size bound, the least recently used results are removed.
+        cache = ResultCache("/tmp/dashboard_cache", version=data_version)
+        query_to_df = cache.wrap("query_to_df", query_to_df)
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 2 ** 20, version=None):
+        """
+        Args:
+            directory (str): directory of the cache, shared by every process
+            max_bytes (int, optional): size bound of the stored results. Defaults to DEFAULT_MAX_MB.
+            version (function, optional): returns the current data version, part of every key. Defaults to None.
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.lock_directory = os.path.join(directory, "locks")
+        os.makedirs(self.lock_directory, exist_ok=True)
+
+        self.stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "waits": 0, "writes": 0, "evictions": 0}
+
+    def count(self, name, value=1):
+        """Adds to one of the stats counters
+        """
+
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def key(self, name, args, kwargs):
+        """Builds the key of a call
+
+        Args:
+            name (str): name of the cached function
+            args (tuple): positional arguments of the call
+            kwargs (dict): keyword arguments of the call
+
+        Returns:
+            str: hex digest
+        """
+
+        digest = hashlib.sha1()
+        fingerprint(name, digest)
+        fingerprint(self.version() if self.version is not None else None, digest)
+        fingerprint(args, digest)
+        fingerprint(kwargs, digest)
+        return digest.hexdigest()
+
+    def paths(self, key):
+        """Candidate result files of a key, one per serialization format
+
+        Returns:
+            list: file paths
+        """
+
+        return [
+            os.path.join(self.directory, key + suffix)
+            for suffix in (".arrow", ".json", ".pkl")
+        ]
+
+    def read(self, key):
+        """Reads a stored result, marking it as recently used
+
+        Args:
+            key (str): key from key()
+
+        Returns:
+            tuple: (found, value)
+        """
+
+        for path in self.paths(key):
+            if path.endswith(".arrow") and feather is None:
+                continue
+            try:
+                if path.endswith(".arrow"):
+                    value = feather.read_feather(path)
+                elif path.endswith(".json"):
+                    with open(path) as f:
+                        value = pio.from_json(f.read())
+                else:
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+            except FileNotFoundError:
+                # not stored in this format, or evicted in between
+                continue
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return True, value
+        return False, None
+
+    def write(self, key, value):
+        """Stores a result atomically
+
+        Args:
+            key (str): key from key()
+            value (object): result to store
+        """
+
+        arrow, figure, other = self.paths(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            path = None
+            if isinstance(value, pd.DataFrame) and feather is not None:
+                try:
+                    feather.write_feather(value, tmp)
+                    path = arrow
+                except pa.ArrowException:
+                    # e.g. object columns mixing types, pickled instead
+                    pass
+            elif isinstance(value, BaseFigure):
+                with open(tmp, "w") as f:
+                    f.write(value.to_json())
+                path = figure
+            if path is None:
+                with open(tmp, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                path = other
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.count("writes")
+
+    def lock_path(self, key):
+        """Lock file guarding the computation of a key
+        """
+
+        return os.path.join(self.lock_directory, key + ".lock")
+
+    def acquire(self, key):
+        """Takes the exclusive lock of a key, waiting for any process computing it
+
+        Args:
+            key (str): key from key()
+
+        Returns:
+            file: the locked file, see release()
+        """
+
+        path = self.lock_path(key)
+        while True:
+            lock = open(path, "a")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                locked = os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino
+            except FileNotFoundError:
+                locked = False
+            if locked:
+                return lock
+            # removed by its previous holder while this one waited, lock the current file instead
+            lock.close()
+
+    def release(self, key, lock):
+        """Removes the lock file of a key then releases it, so lock files do not pile up
+
+        Args:
+            key (str): key from key()
+            lock (file): the locked file from acquire()
+        """
+
+        try:
+            os.remove(self.lock_path(key))
+        finally:
+            lock.close()
+
+    def get_or_compute(self, key, compute):
+        """Returns the stored result of a key, computing and storing it on a miss
+
+        Args:
+            key (str): key from key()
+            compute (function): computes the result, without arguments
+
+        Returns:
+            object: the result
+        """
+
+        found, value = self.read(key)
+        if found:
+            self.count("hits")
+            return value
+
+        lock = self.acquire(key)
+        try:
+            # another process may have computed it while this one waited for the lock
+            found, value = self.read(key)
+            if found:
+                self.count("waits")
+                return value
+            self.count("misses")
+            value = compute()
+            self.write(key, value)
+        finally:
+            self.release(key, lock)
+        self.evict()
+        return value
+
+    def evict(self):
+        """Removes the least recently used results until the directory is under its size bound
+        """
+
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.count("evictions")
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def wrap(self, name, func):
+        """Memoizes a function in the cache
+
+        Args:
+            name (str): name of the function in the keys
+            func (function): function to memoize
+
+        Returns:
+            function: the memoized function
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.get_or_compute(
+                self.key(name, args, kwargs), lambda: func(*args, **kwargs)
+            )
+
+        return wrapper
+
+
+def from_env(version=None):
+    """Creates the shared cache configured by DASHBOARD_CACHE_DIR and DASHBOARD_CACHE_MAX_MB
+
+    Args:
+        version (function, optional): returns the current data version. Defaults to None.
+
+    Returns:
+        ResultCache: the shared cache, None when DASHBOARD_CACHE_DIR is not set
+    """
+
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if not directory:
+        return None
+    max_mb = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_MAX_MB))
+    return ResultCache(directory, max_bytes=int(max_mb * 2 ** 20), version=version)
@@ -0,0 +1,146 @@
+"""Synthetic covid_master.db data and JHU sources, shared by the benchmarks and the tests
+
+The payloads have every column of ETLConfigs.SQL_DTYPES and are published the way the full pipeline does,
+so the schema, geo grid, indexes and views are the ones the dashboards read. Each caller picks its own locations.
+The sources are laid out as the JHU time series csv files, for the benchmarks of the covid pipeline.
+"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from etl.constants import ETLConfigs
+from utils import DBUpdates
+
+# first day of the JHU time series, in days since the epoch as covid_daily stores it
+FIRST_DAY = (dt.date(2020, 1, 22) - dt.date(1970, 1, 1)).days
+# mean daily value of the measures without a rate of their own
+DEFAULT_RATE = 20
+# countries of the global sources, the USA total and Burma rows are dropped and renamed by the quality checks
+SOURCE_COUNTRIES = ["US", "Burma", "Canada", "France", "Germany", "India"]
+
+
+def synthetic_body(locations, n_days, seed=0, rates=None):
+    """Builds a covid_daily payload with every column of ETLConfigs.SQL_DTYPES
+
+    Args:
+        locations (pd.DataFrame): location columns, one row per location
+        n_days (int): number of days of every location
+        seed (int, optional): random seed of the measures. Defaults to 0.
+        rates (dict, optional): mean daily value of each measure. Defaults to None, DEFAULT_RATE for all.
+
+    Returns:
+        pd.DataFrame: one row per location and day, as CovidPipeline.transform() loads it
+    """
+
+    rng = np.random.RandomState(seed)
+    rates = rates or {}
+    body = pd.DataFrame(
+        {
+            column: np.tile(locations[column].to_numpy(), n_days)
+            for column in ETLConfigs.LOCATION_COLUMNS
+        }
+    )
+    body["date"] = np.repeat(np.arange(FIRST_DAY, FIRST_DAY + n_days), len(locations))
+    # every measure the pipeline fills, as the views sum all of them
+    for column, dtype in ETLConfigs.SQL_DTYPES.items():
+        if column not in body and dtype == "INTEGER":
+            body[column] = rng.poisson(rates.get(column, DEFAULT_RATE), len(body))
+    body["etl_load_time"] = dt.datetime(2020, 5, 20)
+    return body
+
+
+def publish_body(database, body):
+    """Publishes a payload the way the full pipeline does: staging, geo grid, indexes and swap
+
+    Args:
+        database (DBUpdates): database to publish to
+        body (pd.DataFrame): payload from synthetic_body()
+    """
+
+    with database:
+        database.create_table()
+        database.insert_to_table(body)
+        database.build_geo_grid()
+        database.create_staging_indexes()
+        database.publish()
+
+
+def build_covid_db(directory, locations, n_days, seed=0, rates=None):
+    """Writes covid_master.db with synthetic measures of the locations
+
+    Args:
+        directory (str): directory to write covid_master.db to
+        locations (pd.DataFrame): location columns, one row per location
+        n_days (int): number of days of every location
+        seed (int, optional): random seed of the measures. Defaults to 0.
+        rates (dict, optional): mean daily value of each measure. Defaults to None, DEFAULT_RATE for all.
+
+    Returns:
+        DBUpdates: the database written to
+    """
+
+    database = DBUpdates()
+    database.project_root = directory
+    publish_body(database, synthetic_body(locations, n_days, seed, rates))
+    return database
+
+
+def synthetic_sources(n_global, n_usa, n_days, seed=0, rates=None):
+    """Builds the wide time series of every source of ETLConfigs.SOURCES, with the columns of the JHU csv files
+
+    Args:
+        n_global (int): number of locations of the global sources, the first one being the USA total
+        n_usa (int): number of counties of the usa sources
+        n_days (int): number of date columns
+        seed (int, optional): random seed. Defaults to 0.
+        rates (dict, optional): mean daily value of each measure. Defaults to None, DEFAULT_RATE for all.
+
+    Returns:
+        dictionary: source name as key, cumulative values one row per location as value
+    """
+
+    rng = np.random.RandomState(seed)
+    rates = rates or {}
+    dates = pd.date_range(dt.date(2020, 1, 22), periods=n_days)
+    header = [f"{d.month}/{d.day}/{d:%y}" for d in dates]
+    places = {
+        "global": pd.DataFrame(
+            {
+                "Province/State": [None] + [f"S{i}" for i in range(1, n_global)],
+                "Country/Region": [
+                    SOURCE_COUNTRIES[i % len(SOURCE_COUNTRIES)] for i in range(n_global)
+                ],
+                "Lat": rng.uniform(-60, 70, n_global).round(4),
+                "Long": rng.uniform(-180, 180, n_global).round(4),
+            }
+        ),
+        "usa": pd.DataFrame(
+            {
+                "UID": np.arange(n_usa),
+                "iso2": "US",
+                "iso3": "USA",
+                "code3": 840,
+                "FIPS": np.arange(n_usa),
+                "Admin2": [f"A{i}" for i in range(n_usa)],
+                "Province_State": [f"St{i % 50}" for i in range(n_usa)],
+                "Country_Region": "US",
+                "Lat": rng.uniform(25, 48, n_usa).round(4),
+                "Long_": rng.uniform(-124, -67, n_usa).round(4),
+                "Combined_Key": [f"A{i}, St{i % 50}, US" for i in range(n_usa)],
+            }
+        ),
+    }
+
+    sources = {}
+    for name, source in ETLConfigs.SOURCES.items():
+        locations = places[source["region"]]
+        if source["region"] == "usa" and source["measure"] == "death":
+            locations = locations.assign(Population=rng.randint(1000, 10 ** 6, n_usa))
+        rate = rates.get(source["measure"], DEFAULT_RATE)
+        values = np.cumsum(rng.poisson(rate, (len(locations), n_days)), axis=1)
+        sources[name] = pd.concat(
+            [locations, pd.DataFrame(values, columns=header)], axis=1
+        )
+    return sources
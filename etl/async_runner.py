@@ -0,0 +1,151 @@
+import asyncio
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from etl.constants import ETLConfigs
+
+
+class PipelinedRunner:
+    """ Class for running a CovidPipeline with the extract, transform and load steps overlapped across sources
+
+    Payload and interface
+    ---------------------
+    Downloads and transforms are offloaded to a thread pool and driven by an asyncio event loop,
+    so a source starts transforming as soon as its own download completes.
+    Each source group (e.g. global, usa) is loaded into the staging table as soon as all of its measures are ready.
+    Loads run on the event loop thread, which owns the SQLite connection.
+    The block hashes of the sources are staged along with the data, so the next run can revise it in place.
+    CovidPipeline.load_revisions() also goes through the runner for its full reloads, with the sources it already extracted.
+
+    Pipeline
+    --------
+    1. Setup
+        i) Create staging table
+    2. Extract, Transform, Load (per source group, concurrently)
+        i) Download, hash and calculate daily deltas for each measure of the group
+        ii) Align the measures and unpivot them in one pass
+        iii) Append the group into the staging table
+    3. Teardown
+        i) Stage the source hashes, then aggregate, index and publish the staging tables, only once every group is loaded
+        ii) Record the quality report of every group
+    """
+
+    def __init__(self, pipeline, max_in_flight=ETLConfigs.MAX_IN_FLIGHT):
+        """
+        Args:
+            pipeline (CovidPipeline): pipeline providing the step implementations and the db interface
+            max_in_flight (int, optional): maximum number of source groups held in memory at once.
+                Defaults to ETLConfigs.MAX_IN_FLIGHT.
+        """
+
+        self.pipeline = pipeline
+        self.source_groups = pipeline.source_groups
+        self.max_in_flight = max_in_flight
+        self.staging_created = False
+        self.extracted = False
+        self.hashes = []
+
+    async def extract_transform(self, executor, source_name):
+        """Download and hash a single source, validate it and calculate its daily deltas off the event loop.
+        Sources already extracted into the pipeline are only transformed
+
+        Args:
+            executor (ThreadPoolExecutor): pool running the blocking download and transform
+            source_name (str): key of the source in ETLConfigs.SOURCES
+
+        Returns:
+            tuple: daily deltas of the source, see CovidPipeline.calculate_daily_delta()
+        """
+
+        loop = asyncio.get_event_loop()
+        if self.extracted:
+            df = getattr(self.pipeline, "df_{}".format(source_name))
+        else:
+            url = self.pipeline.sources.url(source_name)
+            df = await loop.run_in_executor(executor, self.pipeline.download_to_df, url)
+            # hashed before the transform, which validates the source in place
+            source_hashes = await loop.run_in_executor(
+                executor, self.pipeline.hash_source, source_name, df
+            )
+            self.hashes.append(source_hashes)
+        return await loop.run_in_executor(
+            executor, self.pipeline.transform_source, df, source_name
+        )
+
+    async def process_group(self, executor, semaphore, group, load_time):
+        """Extract and transform every measure of a source group, then load it into staging
+
+        Args:
+            executor (ThreadPoolExecutor): pool running the blocking download and transform
+            semaphore (asyncio.Semaphore): bounds the number of groups in flight
+            group (str): region of the group, see SourceRegistry.groups()
+            load_time (datetime): etl_load_time shared by every group of the run
+        """
+
+        loop = asyncio.get_event_loop()
+        sources = self.source_groups[group]
+        async with semaphore:
+            deltas = await asyncio.gather(
+                *[
+                    self.extract_transform(executor, source)
+                    for source in sources.values()
+                ]
+            )
+            body = await loop.run_in_executor(
+                executor,
+                self.pipeline.combine_measures,
+                dict(zip(sources.values(), deltas)),
+            )
+            body = await loop.run_in_executor(
+                executor, self.pipeline.clean, body, load_time
+            )
+
+            # the first group recreates the staging table, the rest are appended
+            if_exists = "append" if self.staging_created else "replace"
+            self.staging_created = True
+            self.pipeline.database.insert_to_table(body, if_exists=if_exists)
+            self.pipeline.rows_written += len(body)
+
+    async def run_groups(self):
+        """Schedule every source group concurrently and wait for all of them to be loaded
+        """
+
+        load_time = self.pipeline.load_time = dt.datetime.now()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        n_sources = sum(len(sources) for sources in self.source_groups.values())
+        with ThreadPoolExecutor(max_workers=n_sources) as executor:
+            await asyncio.gather(
+                *[
+                    self.process_group(executor, semaphore, group, load_time)
+                    for group in self.source_groups
+                ]
+            )
+
+    def load(self, hashes=None):
+        """Stages every source group and its hashes, then publishes them once all of them are loaded
+
+        Args:
+            hashes (pd.DataFrame, optional): hashes of the sources already extracted into the pipeline,
+                see CovidPipeline.load_revisions(). Defaults to None, the sources are then downloaded and hashed.
+        """
+
+        self.staging_created = False
+        self.extracted = hashes is not None
+        self.hashes = [] if hashes is None else [hashes]
+        self.pipeline.rows_written = 0
+        self.pipeline.setup()
+        asyncio.run(self.run_groups())
+        self.pipeline.database.insert_source_hashes(
+            pd.concat(self.hashes, ignore_index=True)
+        )
+        self.pipeline.teardown()
+
+    def run_pipeline(self):
+        """Defines pipeline steps, the publish only happens once every group is in staging
+        """
+
+        self.pipeline.quality.reset()
+        with self.pipeline.database:
+            self.load()
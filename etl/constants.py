@@ -1,14 +1,5 @@
 class ETLConfigs:
 
-    # source data
-    DF_NAME_URL_DICT = {
-        "confirmed_global": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv",
-        "confirmed_usa": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv",
-        "death_global": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv",
-        "death_usa": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv",
-        "recovered_global": "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv",
-    }
-
     # renaming column names
     LOCATION_COLUMN_DICT = {
         "Province_State": "state",
@@ -20,6 +11,45 @@ class ETLConfigs:
         "Long": "longitude",
     }
     LOCATION_COLUMNS = ["country", "state", "latitude", "longitude"]
+
+    # source data: every JHU time series with the region it covers, the measure it holds,
+    # and the columns identifying its locations. Sources of a region are aligned on their locations and days
+    # and unpivoted together, see SourceRegistry
+    SOURCES = {
+        "confirmed_global": {
+            "url": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv",
+            "region": "global",
+            "measure": "confirmed",
+            "key_columns": LOCATION_COLUMNS,
+        },
+        "death_global": {
+            "url": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv",
+            "region": "global",
+            "measure": "death",
+            "key_columns": LOCATION_COLUMNS,
+        },
+        "recovered_global": {
+            "url": "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv",
+            "region": "global",
+            "measure": "recovered",
+            "key_columns": LOCATION_COLUMNS,
+        },
+        "confirmed_usa": {
+            "url": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv",
+            "region": "usa",
+            "measure": "confirmed",
+            "key_columns": LOCATION_COLUMNS,
+        },
+        "death_usa": {
+            "url": "https://raw.githubusercontent.com/cssegisanddata/covid-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv",
+            "region": "usa",
+            "measure": "death",
+            "key_columns": LOCATION_COLUMNS,
+        },
+    }
+
+    # date headers in the source csv, stored as days since 1970-01-01
+    DATE_FORMAT = "%m/%d/%y"
     DROP_COLUMNS = [
         "UID",
         "iso2",
@@ -31,6 +61,7 @@ class ETLConfigs:
         "Population",
     ]
     COUNTRY_NAME_DICT = {
+        "US": "United States",
         "Burma": "Myanmar",
         "Congo (Brazzaville)": "Congo",
         "Congo (Kinshasa)": "Congo",
@@ -38,27 +69,57 @@ class ETLConfigs:
         "Korea, South": "Korea, Republic of",
     }
 
+    # pipelined runner: number of source regions held in memory at once
+    MAX_IN_FLIGHT = 2
+
+    # revision detection: number of date columns hashed together per location
+    REVISION_BLOCK_DAYS = 28
+
     # SQL properties
     DB_NAME = "covid_master"
     TABLE_NAME = "covid_daily"
     SETUP_SQL_SCRIPT = "setup_table"
     SWAP_SQL_SCRIPT = "swap_table"
+    GRID_SQL_SCRIPT = "build_geo_grid"
+    GRID_LOCATIONS_SQL_SCRIPT = "grid_locations"
+    INDEX_SQL_SCRIPT = "index_staging"
+    REVISIONS_SQL_SCRIPT = "apply_revisions"
+    REVISE_GRID_SQL_SCRIPT = "revise_geo_grid"
+    # fixed grid zoom levels and their cell size in degrees, coarse to fine
+    GRID_CELL_DEGREES = {0: 45.0, 1: 15.0, 2: 5.0, 3: 1.0, 4: 0.25}
     SQL_DTYPES = {
         "country": "TEXT",
         "state": "TEXT",
         "latitude": "REAL",
         "longitude": "REAL",
-        "date": "TEXT",
+        "date": "INTEGER",
         "confirmed": "INTEGER",
         "death": "INTEGER",
+        "recovered": "INTEGER",
         "etl_load_time": "TEXT",
     }
+    QUALITY_TABLE_NAME = "quality_report"
+    QUALITY_SQL_DTYPES = {
+        "etl_load_time": "TEXT",
+        "source": "TEXT",
+        "check_name": "TEXT",
+        "count": "INTEGER",
+        "detail": "TEXT",
+    }
+    HASH_SQL_DTYPES = {
+        "source": "TEXT",
+        "location": "TEXT",
+        "block": "INTEGER",
+        "n_days": "INTEGER",
+        "row_hash": "INTEGER",
+    }
 
 
 class WorldPopConfig:
 
     # source data
     POP_URL = "https://www.worldometers.info/world-population/population-by-country/"
+    POP_ENCODING = "utf-8"
 
     # DataFrame properties
     HEADER_DICT = {
@@ -75,6 +136,8 @@ class WorldPopConfig:
         "Urban Pop %": "urban_pop_perc",
         "World Share": "population_world_share",
     }
+    # columns kept as scraped, all others are parsed as numbers
+    TEXT_COLUMNS = ["Country (or dependency)"]
     COUNTRY_NAME_DICT = {
         "DR Congo": "Congo",
         "Laos": "Lao People's Democratic Republic",
@@ -93,23 +156,70 @@ class WorldPopConfig:
     # SQL properties
     DB_NAME = "population"
     TABLE_NAME = "world_population"
-    SETUP_SQL = f"DROP TABLE IF EXISTS {TABLE_NAME}"
+    STAGING_TABLE_NAME = f"{TABLE_NAME}_new"
+    SETUP_SQL = f"DROP TABLE IF EXISTS {STAGING_TABLE_NAME}"
+    SWAP_SQL = f"""
+    BEGIN IMMEDIATE;
+    DROP TABLE IF EXISTS {TABLE_NAME};
+    ALTER TABLE {STAGING_TABLE_NAME} RENAME TO {TABLE_NAME};
+    COMMIT;
+    """
     SQL_DTYPES = {
         "id": "INTEGER",
         "country": "TEXT",
         "population_2020": "INTEGER",
-        "yoy_delta_perc": "TEXT",
-        "yay_delta_amt": "INTEGER",
+        "yoy_delta_perc": "REAL",
+        "yoy_delta_amt": "INTEGER",
         "density_km2": "INTEGER",
         "land_km2": "INTEGER",
         "net_migrants": "INTEGER",
         "fertility_rate": "REAL",
         "median_age": "INTEGER",
-        "urban_pop_perc": "TEXT",
-        "population_world_share": "TEXT",
+        "urban_pop_perc": "REAL",
+        "population_world_share": "REAL",
     }
 
 
+class SchedulerConfig:
+
+    # SQL properties
+    DB_NAME = "etl_state"
+    TABLE_NAME = "pipeline_runs"
+    SETUP_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME}
+    (
+        pipeline        TEXT PRIMARY KEY,
+        last_success    TEXT,
+        fingerprint     TEXT
+    )
+    """
+
+    # pipelines are skipped while their data is younger than the TTL
+    TTL_HOURS = {
+        "covid_daily": 20,
+        "world_population": 24 * 30,
+    }
+    SOURCE_URLS = {
+        "covid_daily": [source["url"] for source in ETLConfigs.SOURCES.values()],
+        "world_population": [WorldPopConfig.POP_URL],
+    }
+    FINGERPRINT_HEADERS = ["ETag", "Last-Modified", "Content-Length"]
+    # a source answering slower than this counts as unreachable, and its pipeline as due
+    REQUEST_TIMEOUT_SECONDS = 30
+
+
+class DaemonConfig:
+
+    # polling and local health/metrics endpoint
+    POLL_SECONDS = 600
+    HOST = "127.0.0.1"
+    PORT = 8765
+    # seconds to wait for a source to respond, a stalled connection would otherwise hang the poll
+    REQUEST_TIMEOUT_SECONDS = 60
+    # /health reports an error once the last success is older than this many poll intervals
+    STALE_INTERVALS = 2
+
+
 class DBViewConfig:
 
     DB_NAME = ETLConfigs.DB_NAME
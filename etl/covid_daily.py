@@ -10,8 +10,12 @@ from io import StringIO
 
 pd.options.mode.chained_assignment = None
 
+from etl.async_runner import PipelinedRunner
 from etl.constants import ETLConfigs
-from utils import DBUpdates, CreateViews
+from etl.quality import QualityChecker
+from etl.revisions import RevisionDetector
+from etl.sources import SourceRegistry
+from utils import DBUpdates
 
 
 class CovidPipeline:
@@ -27,27 +31,39 @@ class CovidPipeline:
     1. Setup
         i) Create staging table
     2. Extract
-        i) Extract csv file from source gitrepo
+        i) Extract the csv file of every registered source from the gitrepo
     3. Transform
-        i) Transform and merge the data
+        i) Validate the locations of each source, and calculate its daily deltas
+        ii) Align the measures of each region on their locations and days, and unpivot them in one pass
     4. Load
-        i) Insert dataframes into staging table
+        i) Insert dataframes into staging table, along with the block hashes of the sources
     5. Teardown
-        i) Swap staging and drop old table
+        i) Aggregate staging into the geo grid and index the staging tables
+        ii) Swap staging, drop old tables and recreate views in one transaction
+        iii) Record the quality report of the run
     """
 
-    def __init__(self, dbupdates=DBUpdates(), createviews=CreateViews()):
-        # Payload and sql interface
-        self.database = dbupdates
-        self.createviews = createviews
+    def __init__(self, dbupdates=None, sources=None):
+        # Payload and sql interface, the connection is only opened once a run starts
+        self.database = dbupdates if dbupdates is not None else DBUpdates()
+        self.sources = sources if sources is not None else SourceRegistry()
+        self.detector = RevisionDetector()
+        self.quality = QualityChecker()
         self.body = pd.DataFrame()
+        self.load_time = None
+        self.rows_written = 0
+        # daily deltas of every source kept by a long running process, see warm_source(). Not kept when None
+        self.warm = None
+        self.no_hashes = pd.DataFrame(columns=list(ETLConfigs.HASH_SQL_DTYPES))
 
         # String properties
-        self.df_names_url_dict = ETLConfigs.DF_NAME_URL_DICT
         self.drop_columns = ETLConfigs.DROP_COLUMNS
         self.location_column_dict = ETLConfigs.LOCATION_COLUMN_DICT
         self.locations = ETLConfigs.LOCATION_COLUMNS
         self.country_dict = ETLConfigs.COUNTRY_NAME_DICT
+        self.date_format = ETLConfigs.DATE_FORMAT
+        self.source_groups = self.sources.groups()
+        self.measures = self.sources.measures()
 
     def download_to_df(self, url):
         """Given an url to a hosted csv file, download and stores as DataFrame
@@ -58,77 +74,226 @@ class CovidPipeline:
         """
         with requests.Session() as s:
             download = s.get(url)
-            decoded_content = download.content.decode("utf-8")
-            csv_data = StringIO(decoded_content)
-            df = pd.read_csv(csv_data, delimiter=",")
+            df = self.parse_csv(download.content)
         return df
 
-    def format_date(self, original_date):
-        """Turns a MM/DD/YY date format into YYYY/MM/DD format
+    def parse_csv(self, content):
+        """Reads the content of a downloaded csv file into a DataFrame
         Arguments:
-            original_date {string} -- date in MM/DD/YY format
+            content {bytes} -- body of the csv download
         Returns:
-            string -- date in YYYY/MM/DD format
+            DataFrame -- contents of the csv stored in a DataFrame object
         """
-        renamed_date = dt.datetime.strptime(original_date, "%m/%d/%y")
-        return renamed_date
+        decoded_content = content.decode("utf-8")
+        csv_data = StringIO(decoded_content)
+        return pd.read_csv(csv_data, delimiter=",")
 
-    def calculate_daily_delta(self, df, category):
-        """Takes the raw download from the gitrepo csv files then does three things:
-                Drop the US sepcific columns and rename the rest to standardize
-                Reformat the dates with format_date() method and calculate the daily variance
-                Unpivot pd.melt() the date columns so that the measures are are all under one date column
+    def format_dates(self, original_dates):
+        """Parses all MM/DD/YY date headers at once into integer day ordinals
+        Arguments:
+            original_dates {list} -- dates in MM/DD/YY format
+        Returns:
+            np.ndarray -- days since 1970-01-01, as stored in the date column
+        """
+        parsed = pd.to_datetime(pd.Index(original_dates), format=self.date_format)
+        return parsed.values.astype("datetime64[D]").astype(np.int64)
+
+    def standardize_columns(self, df):
+        """Drop the US sepcific columns and rename the rest to standardize, in place
         Arguments:
             df {DataFrame} -- downloaded csv from gitrepo
-            category {string} -- category of the csv (confirmed or deaths)
         Returns:
-            DataFrame -- DataFrame is in the resulting format ready for db insert
+            DataFrame -- the same DataFrame, with location columns followed by date columns
         """
 
         # drop extra columns existing uniquely in the US specific data
         df.drop(columns=self.drop_columns, inplace=True, errors="ignore")
         # rename columns to standardize
         df.rename(columns=self.location_column_dict, inplace=True, errors="ignore")
+        return df
+
+    def validate_locations(self, df, source):
+        """Standardize the columns of a source, drop its USA total rows and standardize its country names
+        Arguments:
+            df {DataFrame} -- downloaded csv from gitrepo
+            source {string} -- key of the source in ETLConfigs.SOURCES
+        Returns:
+            DataFrame -- the validated wide source, see QualityChecker.validate_locations()
+        """
+
+        return self.quality.validate_locations(self.standardize_columns(df), source)
+
+    def calculate_daily_delta(self, df, source):
+        """Parse the dates of a validated source with format_dates() and calculate the daily variance, checking it on the way
+        Arguments:
+            df {DataFrame} -- downloaded csv from gitrepo, validated with validate_locations()
+            source {string} -- key of the source in ETLConfigs.SOURCES
+        Returns:
+            tuple -- (locations, days, daily)
+                locations {DataFrame} -- location columns, indexed by the key columns of the source
+                days {np.ndarray} -- day ordinal of each date column
+                daily {np.ndarray} -- daily values, one row per location and one column per date
+        """
+
         # set column lists
-        all_columns = list(df.columns.values)
-        dates = [i for i in all_columns if i not in self.locations]
-        # create target payload
-        df_locations = df[self.locations]
-        df_dates = df[dates]
-        # replace dates to datetime format and calculate daily cases (rather than cumulative)
-        for i in range(len(df_dates.columns)):
-            # except for the first date as it is a starting point
-            # only date formatting is performed
-            if i == 0:
-                df_dates.rename(
-                    columns={
-                        df_dates.columns[0]: self.format_date(df_dates.columns[0])
-                    },
-                    inplace=True,
-                )
-            # other columns will be a difference between adjascent days
-            # a new column is created as well as date formatting
-            else:
-                df_dates["{}".format(self.format_date(df_dates.columns[i]))] = (
-                    df_dates.iloc[:, i] - df_dates.iloc[:, (i - 1)]
-                )
-        # remove the old date columns
-        df_dates.drop(columns=dates, inplace=True, errors="ignore")
-        # put it all together
-        df_merged = df_locations.merge(
-            df_dates, how="outer", left_index=True, right_index=True
+        dates = [i for i in df.columns if i not in self.locations]
+        days = self.format_dates(dates)
+        # calculate daily cases (rather than cumulative)
+        # the first date is kept as is as it is the starting point
+        cumulative = df[dates].to_numpy()
+        daily = np.diff(cumulative, axis=1, prepend=0)
+        self.quality.check_deltas(source, daily)
+        locations = df[self.locations]
+        locations.index = self.detector.location_keys(
+            df, self.sources.key_columns(source)
+        ).to_numpy()
+        return locations, days, daily
+
+    def transform_source(self, df, source):
+        """Validate a downloaded source and calculate its daily deltas
+        Arguments:
+            df {DataFrame} -- downloaded csv from gitrepo
+            source {string} -- key of the source in ETLConfigs.SOURCES
+        Returns:
+            tuple -- daily deltas of the source, see calculate_daily_delta()
+        """
+
+        if self.warm is not None:
+            return self.warm_source(df, source)[1]
+        return self.calculate_daily_delta(self.validate_locations(df, source), source)
+
+    def warm_source(self, df, source):
+        """Validate a whole downloaded source and calculate its daily deltas, then keep them in memory
+        so that revise() only has to slice them. The downloaded DataFrame is not modified
+        Arguments:
+            df {DataFrame} -- downloaded csv from gitrepo
+            source {string} -- key of the source in ETLConfigs.SOURCES
+        Returns:
+            tuple -- (keys, deltas)
+                keys {np.ndarray} -- key of the downloaded row of each validated location, on the key columns of the source
+                deltas {tuple} -- daily deltas of the source, see calculate_daily_delta()
+        """
+
+        df = self.standardize_columns(df)
+        keys = self.detector.location_keys(
+            df, self.sources.key_columns(source)
+        ).to_numpy()
+        # keyed by the source location, as validation may drop rows and rename countries
+        df = self.validate_locations(df.set_index(keys), source)
+        self.warm[source] = (
+            df.index.to_numpy(),
+            self.calculate_daily_delta(df, source),
         )
-        # melt(unpivot) the date columns so that they are all under one column
-        dates = [i for i in df_merged.columns if i not in self.locations]
-        df_melt = pd.melt(
-            df_merged,
-            id_vars=self.locations,
-            value_vars=dates,
-            var_name="date",
-            value_name=category,
+        return self.warm[source]
+
+    def align_measures(self, deltas):
+        """Align the daily deltas of the sources of a region on their shared location and day axis.
+        Locations are matched on their key, with an occurrence number for rows sharing it.
+        Sources covering every location and day of the region are used as is, the others are spread with NaN on the gaps
+        Arguments:
+            deltas {dict} -- calculate_daily_delta() output of each source of the region, by source name
+        Returns:
+            tuple -- (locations, days, values, covered)
+                locations {DataFrame} -- location columns of every location found in any of the sources
+                days {np.ndarray} -- every day ordinal found in any of the sources
+                values {dict} -- daily values of each measure, one row per location and one column per day
+                covered {np.ndarray} -- location days found in any of the sources, None when all of them are
+        """
+
+        keys = {}
+        for source, (locations, _, _) in deltas.items():
+            occurrence = locations.groupby(level=0).cumcount().to_numpy()
+            keys[source] = pd.MultiIndex.from_arrays([locations.index, occurrence])
+        all_locations = pd.concat(
+            [
+                locations.set_axis(keys[source])
+                for source, (locations, _, _) in deltas.items()
+            ]
+        )
+        all_locations = all_locations[~all_locations.index.duplicated()]
+        all_days = np.unique(np.concatenate([days for _, days, _ in deltas.values()]))
+        shape = (len(all_locations), len(all_days))
+
+        values, gaps = {}, {}
+        covered = None
+        for source, (_, days, daily) in deltas.items():
+            if keys[source].equals(all_locations.index) and np.array_equal(
+                days, all_days
+            ):
+                values[self.sources.measure(source)] = daily
+                covered = np.ones(shape, dtype=bool)
+                continue
+            positions = np.ix_(
+                all_locations.index.get_indexer(keys[source]),
+                np.searchsorted(all_days, days),
+            )
+            aligned = np.full(shape, np.nan)
+            aligned[positions] = daily
+            values[self.sources.measure(source)] = aligned
+            gaps[source] = daily.size
+            if covered is None:
+                covered = np.zeros(shape, dtype=bool)
+            covered[positions] = True
+
+        if not gaps:
+            return all_locations, all_days, values, None
+        for source, size in gaps.items():
+            self.quality.check_measures(source, covered.sum() - size)
+        return all_locations, all_days, values, None if covered.all() else covered
+
+    def unpivot(self, locations, days, values, keep=None):
+        """Unpivot the aligned measures of a region so that they are all under one date column,
+        ordered date by date as pd.melt() would. Measures the region has no source for are left empty
+        Arguments:
+            locations {DataFrame} -- aligned locations, see align_measures()
+            days {np.ndarray} -- aligned day ordinals
+            values {dict} -- aligned daily values of each measure
+            keep {np.ndarray} -- location days to unpivot, all of them when None (default: {None})
+        Returns:
+            DataFrame -- one row per location and day, with a column per measure
+        """
+
+        keep = slice(None) if keep is None else keep.ravel(order="F")
+        n_locations = len(locations)
+        df_melt = pd.DataFrame(
+            {
+                column: np.tile(locations[column].to_numpy(), len(days))[keep]
+                for column in self.locations
+            }
         )
+        df_melt["date"] = np.repeat(days, n_locations)[keep]
+        for measure in self.measures:
+            if measure in values:
+                df_melt[measure] = values[measure].ravel(order="F")[keep]
+            else:
+                df_melt[measure] = np.nan
         return df_melt
 
+    def combine_measures(self, deltas):
+        """Combine the measures of a region into a single table, see align_measures() and unpivot()
+        Arguments:
+            deltas {dict} -- transform_source() output of each source of the region, by source name
+        Returns:
+            DataFrame -- unpivoted daily deltas of the region
+        """
+
+        return self.unpivot(*self.align_measures(deltas))
+
+    def clean(self, df, load_time):
+        """Stamp the load time.
+        The USA total rows and country names were already handled on the wide sources, see validate_locations(),
+        and the gaps between measures while aligning them, see align_measures()
+        Arguments:
+            df {DataFrame} -- combined figures from combine_measures()
+            load_time {datetime} -- value for the etl_load_time column
+        Returns:
+            DataFrame -- DataFrame ready for db insert, the same object as df
+        """
+
+        # add etl_loadtime field
+        df["etl_load_time"] = load_time
+        return df
+
     def setup(self):
         """Executes setup SQL command to prepare database for the storage of Covid-19 daily data.
         This will create a new staging table
@@ -137,84 +302,225 @@ class CovidPipeline:
 
     def extract(self):
         """Executes the source script for daily covid timeseries data where the csv files hosted
-        on the source gitrepo and store to individual dataframes
+        on the source gitrepo and store to individual dataframes, one per registered source
         """
 
-        self.df_confirmed_global = self.download_to_df(
-            self.df_names_url_dict["confirmed_global"]
-        )
-        self.df_confirmed_usa = self.download_to_df(
-            self.df_names_url_dict["confirmed_usa"]
-        )
-        self.df_death_global = self.download_to_df(
-            self.df_names_url_dict["death_global"]
-        )
-        self.df_death_usa = self.download_to_df(self.df_names_url_dict["death_usa"])
+        for source in self.sources.names():
+            setattr(
+                self,
+                "df_{}".format(source),
+                self.download_to_df(self.sources.url(source)),
+            )
 
     def transform(self):
         """Transform each dataframe to calculate the daily deltas, as well as reformatting the date
-        Then merge all dataframes together, and unpivot the dates so that it'll be in a database friendly format
+        Then align the measures of each region and unpivot the dates so that it'll be in a database friendly format
         """
 
-        # transform date fields, and calculate the daily deltas
-        self.df_confirmed_global = self.calculate_daily_delta(
-            self.df_confirmed_global, "confirmed"
-        )
-        self.df_confirmed_usa = self.calculate_daily_delta(
-            self.df_confirmed_usa, "confirmed"
-        )
-        self.df_death_global = self.calculate_daily_delta(self.df_death_global, "death")
-        self.df_death_usa = self.calculate_daily_delta(self.df_death_usa, "death")
+        self.load_time = dt.datetime.now()
 
-        # join the confirmed and deaths figures by global and USA
-        self.global_all = self.df_confirmed_global.join(
-            self.df_death_global["death"], how="left"
-        )
-        self.usa_all = self.df_confirmed_usa.join(
-            self.df_death_usa["death"], how="left"
-        )
+        # validate locations, transform date fields, and calculate the daily deltas,
+        # then combine the measures of each region in a single unpivot
+        regions = []
+        for sources in self.source_groups.values():
+            deltas = {
+                source: self.transform_source(
+                    getattr(self, "df_{}".format(source)), source
+                )
+                for source in sources.values()
+            }
+            regions.append(self.combine_measures(deltas))
 
         # concatenate everything together as the payload upload
-        self.body = pd.concat([self.global_all, self.usa_all])
+        self.body = self.clean(pd.concat(regions, ignore_index=True), self.load_time)
 
-        # the global dataset contains a daily USA total field which we do not want to include, as it is already in the self.usa_all
-        # it is identified as a null in "state" column.
-        self.body = self.body[
-            ~((self.body["country"] == "US") & (self.body["state"].isnull()))
-        ]
+    def load(self):
+        """Load the finalized DataFrame into the staging table in databse
+        """
 
-        # add etl_loadtime field
-        self.body["etl_load_time"] = dt.datetime.now()
+        self.database.insert_to_table(self.body)
+        self.rows_written = len(self.body)
 
-        # change "US" label to "United States"
-        self.body = self.body.replace(["US"], "United States")
+    def teardown(self):
+        """Build the geo grid and indexes on the staging tables, then publish them
+            The swap and the views are done in one transaction
+        """
 
-        # rename country to be iso standard
-        country = (
-            self.body["country"].map(self.country_dict).fillna(self.body["country"])
+        self.database.build_geo_grid()
+        self.database.create_staging_indexes()
+        self.database.publish()
+        self.database.insert_quality_report(self.quality.report(self.load_time))
+
+    def diff_source(self, source, df, previous):
+        """Hash a downloaded source and compare it with the previous run, see RevisionDetector.diff()
+        Arguments:
+            source {string} -- key of the source in ETLConfigs.SOURCES
+            df {DataFrame} -- downloaded csv from gitrepo, before it is transformed
+            previous {DataFrame} -- hashes stored by the previous run
+        Returns:
+            tuple -- (hashes, changed_hashes, ranges), ranges is None when the source can not be revised in place
+        """
+
+        df = self.standardize_columns(df)
+        dates = [i for i in df.columns if i not in self.locations]
+        return self.detector.diff(
+            source,
+            df,
+            dates,
+            self.format_dates(dates),
+            previous,
+            self.sources.key_columns(source),
         )
-        self.body["country"] = country
 
-    def load(self):
-        """Load the finalized DataFrame into the staging table in databse
+    def hash_source(self, source, df):
+        """Hash a downloaded source, so the next run can revise it in place
+        Arguments:
+            source {string} -- key of the source in ETLConfigs.SOURCES
+            df {DataFrame} -- downloaded csv from gitrepo, before it is transformed
+        Returns:
+            DataFrame -- every block hash of the source
         """
 
-        self.database.insert_to_table(self.body)
+        return self.diff_source(source, df, self.no_hashes)[0]
 
-    def teardown(self):
-        """Swap the existing to old, stage to new, and drop the old
-            Creates views after the swap
+    def revise(self, sources, ranges, load_time):
+        """Recompute the daily deltas of the revised locations of a source group, only within their revised days.
+        When the pipeline is warm, the deltas kept in memory are sliced instead, see warm_source()
+        Arguments:
+            sources {dict} -- measure name and source name of the group, from SourceRegistry.groups()
+            ranges {DataFrame} -- first_day and last_day to recompute, indexed by the location key of the group
+            load_time {datetime} -- value for the etl_load_time column
+        Returns:
+            DataFrame -- revised rows ready for db insert
+        """
+
+        deltas = {}
+        for source in sources.values():
+            df = getattr(self, "df_{}".format(source))
+            if self.warm is not None:
+                if source not in self.warm:
+                    self.warm_source(df, source)
+                keys, (locations, days, daily) = self.warm[source]
+                revised = np.isin(keys, ranges.index)
+                keys, locations, daily = (
+                    keys[revised],
+                    locations[revised],
+                    daily[revised],
+                )
+            else:
+                keys = self.detector.location_keys(df, self.sources.key_columns(source))
+                revised = keys.isin(ranges.index).to_numpy()
+                # keyed by the source location, as validation may drop rows and rename countries
+                df = self.validate_locations(
+                    df[revised].set_index(keys[revised].to_numpy()), source
+                )
+                keys = df.index
+                locations, days, daily = self.calculate_daily_delta(df, source)
+            bounds = ranges.reindex(keys)
+            locations["first_day"] = bounds["first_day"].to_numpy()
+            locations["last_day"] = bounds["last_day"].to_numpy()
+            deltas[source] = (locations, days, daily)
+
+        locations, days, values, covered = self.align_measures(deltas)
+        in_range = (days >= locations["first_day"].to_numpy()[:, None]) & (
+            days <= locations["last_day"].to_numpy()[:, None]
+        )
+        if covered is not None:
+            in_range &= covered
+        return self.clean(self.unpivot(locations, days, values, in_range), load_time)
+
+    def load_revisions(self, previous=None, changed=None):
+        """Hashes the extracted sources and compares them with the previous run, then only the revised locations and days are rewritten.
+        Falls back to a full reload through PipelinedRunner on the first run, or when locations or days were added to or removed from a source
+        Arguments:
+            previous {dict} -- block hashes of each source from the previous run, by source name,
+                kept in memory by a long running process. Read from the database when None
+            changed {list} -- sources extracted again since the previous run, only these are hashed and compared.
+                Every source when None
+        Returns:
+            dict -- every block hash of each source, by source name, matching the database once this returns
+        """
+
+        self.body = pd.DataFrame()
+        self.rows_written = 0
+        self.quality.reset()
+        self.load_time = load_time = dt.datetime.now()
+        if previous is None:
+            previous = dict(tuple(self.database.read_source_hashes().groupby("source")))
+
+        hashes, changed_hashes, group_ranges = {}, [], {}
+        full_reload = False
+        for group, sources in self.source_groups.items():
+            ranges = []
+            for source in sources.values():
+                stored = previous.get(source, self.no_hashes)
+                if changed is not None and source not in changed and not stored.empty:
+                    # not extracted again, its hashes and warm deltas still hold
+                    hashes[source] = stored
+                    continue
+                source_hashes, source_changes, source_ranges = self.diff_source(
+                    source, getattr(self, "df_{}".format(source)), stored
+                )
+                hashes[source] = source_hashes
+                changed_hashes.append(source_changes)
+                if source_ranges is None:
+                    full_reload = True
+                else:
+                    ranges.append(source_ranges)
+                    if self.warm is not None and not source_ranges.empty:
+                        # recomputed by revise() from the new download
+                        self.warm.pop(source, None)
+            if not full_reload and ranges:
+                # a revision in one measure rewrites the whole row, for every measure
+                group_ranges[group] = (
+                    pd.concat(ranges)
+                    .groupby(level=0)
+                    .agg({"first_day": "min", "last_day": "max"})
+                )
+        if full_reload:
+            # the sources are already extracted and hashed, the runner overlaps their transforms and loads
+            PipelinedRunner(self).load(pd.concat(hashes.values(), ignore_index=True))
+            return hashes
+
+        revisions = [
+            self.revise(self.source_groups[group], ranges, load_time)
+            for group, ranges in group_ranges.items()
+            if not ranges.empty
+        ]
+        if revisions:
+            self.body = pd.concat(revisions)
+            self.rows_written = len(self.body)
+            self.database.apply_revisions(
+                self.body, pd.concat(changed_hashes, ignore_index=True)
+            )
+            self.database.insert_quality_report(self.quality.report(load_time))
+        return hashes
+
+    def run_incremental(self):
+        """Defines pipeline steps when only the revised values are reloaded, see load_revisions()
         """
 
-        self.database.swap_tables()
-        self.createviews.create_views()
+        with self.database:
+            self.extract()
+            self.load_revisions()
 
     def run_pipeline(self):
-        """Defines pipeline steps
+        """Defines pipeline steps, each run opens and closes its own database connection
         """
 
-        self.setup()
-        self.extract()
-        self.transform()
-        self.load()
-        self.teardown()
+        self.quality.reset()
+        with self.database:
+            self.setup()
+            self.extract()
+            # hashed before the transform, which validates the sources in place
+            hashes = pd.concat(
+                [
+                    self.hash_source(source, getattr(self, "df_{}".format(source)))
+                    for source in self.sources.names()
+                ],
+                ignore_index=True,
+            )
+            self.transform()
+            self.load()
+            self.database.insert_source_hashes(hashes)
+            self.teardown()
@@ -0,0 +1,245 @@
+import datetime as dt
+import json
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from etl.constants import DaemonConfig
+from etl.covid_daily import CovidPipeline
+
+
+class ETLDaemon:
+    """ Class for keeping the covid pipeline warm in a long running process instead of a cron cold start
+
+    Payload and interface
+    ---------------------
+    The last downloaded wide DataFrame, the block hashes and the daily deltas of every source are kept in memory.
+    Sources are polled with conditional requests (ETag / Last-Modified), so an unchanged source costs a 304 response.
+    When a source changed, only that source is hashed again and only its revised locations and days are rewritten,
+    see CovidPipeline.load_revisions(). The deltas of the other sources of its group are sliced from memory.
+    A local HTTP endpoint exposes /health (JSON) and /metrics (Prometheus text format).
+    Health turns to an error when the last poll failed, or when no poll succeeded for a few intervals, e.g. a poll stalled.
+
+    Pipeline
+    --------
+    1. Poll
+        i) Conditional request for every source, keep the cached DataFrame on 304
+    2. Reload
+        i) When any source changed, hash it against its in-memory hashes and rewrite the revised rows
+    3. Wait
+        i) Sleep for the poll interval, or until stopped
+    """
+
+    def __init__(
+        self,
+        pipeline=None,
+        interval=DaemonConfig.POLL_SECONDS,
+        timeout=DaemonConfig.REQUEST_TIMEOUT_SECONDS,
+    ):
+        """
+        Args:
+            pipeline (CovidPipeline, optional): pipeline providing the steps and the db interface.
+                Defaults to a new CovidPipeline.
+            interval (int, optional): seconds between polls. Defaults to DaemonConfig.POLL_SECONDS.
+            timeout (int, optional): seconds to wait for a source to respond.
+                Defaults to DaemonConfig.REQUEST_TIMEOUT_SECONDS.
+        """
+
+        self.pipeline = pipeline if pipeline is not None else CovidPipeline()
+        self.pipeline.warm = {}
+        self.interval = interval
+        self.timeout = timeout
+        self.started = time.time()
+        self.sources = self.pipeline.sources.names()
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.server = None
+
+        # warm state
+        self.frames = {}
+        self.validators = {}
+        self.hashes = None
+
+        # metrics
+        self.lock = threading.Lock()
+        self.metrics = {
+            "polls_total": 0,
+            "not_modified_total": 0,
+            "source_downloads_total": 0,
+            "reloads_total": 0,
+            "rows_written_total": 0,
+            "errors_total": 0,
+            "last_success_timestamp_seconds": 0.0,
+            "last_poll_duration_seconds": 0.0,
+        }
+        self.last_error = None
+
+    def fetch(self, source):
+        """Conditionally downloads a source, and caches it when it changed
+
+        Args:
+            source (str): key of the source in ETLConfigs.SOURCES
+
+        Returns:
+            bool: True if the source changed since the last poll
+        """
+
+        url = self.pipeline.sources.url(source)
+        etag, last_modified = self.validators.get(source, (None, None))
+        headers = {}
+        if source in self.frames:
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        self.frames[source] = self.pipeline.standardize_columns(
+            self.pipeline.parse_csv(response.content)
+        )
+        self.validators[source] = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        return True
+
+    def poll(self):
+        """Polls every source once and reloads the revised values if any source changed
+
+        Returns:
+            bool: True if the database was updated
+        """
+
+        start = time.monotonic()
+        try:
+            changed = [source for source in self.sources if self.fetch(source)]
+            with self.lock:
+                self.metrics["source_downloads_total"] += len(changed)
+                self.metrics["not_modified_total"] += len(self.sources) - len(changed)
+            if changed:
+                with self.pipeline.database:
+                    # a warm pipeline does not modify the cached DataFrames
+                    for source, df in self.frames.items():
+                        setattr(self.pipeline, "df_{}".format(source), df)
+                    self.hashes = self.pipeline.load_revisions(self.hashes, changed)
+                with self.lock:
+                    self.metrics["reloads_total"] += 1
+                    self.metrics["rows_written_total"] += self.pipeline.rows_written
+        except Exception as error:
+            # the database may not match the in-memory state anymore, start over from it
+            self.hashes = None
+            self.validators = {}
+            self.pipeline.warm = {}
+            with self.lock:
+                self.metrics["errors_total"] += 1
+                self.last_error = repr(error)
+            return False
+        finally:
+            with self.lock:
+                self.metrics["polls_total"] += 1
+                self.metrics["last_poll_duration_seconds"] = time.monotonic() - start
+        with self.lock:
+            self.metrics["last_success_timestamp_seconds"] = time.time()
+            self.last_error = None
+        return bool(changed)
+
+    def health(self):
+        """Summarizes the state of the daemon
+
+        Returns:
+            dictionary: status is "ok" unless the last poll failed or no poll succeeded for
+                DaemonConfig.STALE_INTERVALS intervals
+        """
+
+        with self.lock:
+            last_success = self.metrics["last_success_timestamp_seconds"]
+            # before the first success, the daemon is given as long since it started
+            stale = (
+                time.time() - max(last_success, self.started)
+                > DaemonConfig.STALE_INTERVALS * self.interval
+            )
+            return {
+                "status": "error" if self.last_error or stale else "ok",
+                "last_error": self.last_error,
+                "stale": stale,
+                "last_success": dt.datetime.fromtimestamp(last_success).isoformat()
+                if last_success
+                else None,
+                "interval_seconds": self.interval,
+                "cached_sources": sorted(self.frames),
+            }
+
+    def render_metrics(self):
+        """Renders the metrics in the Prometheus text exposition format
+
+        Returns:
+            str: one sample per metric
+        """
+
+        lines = []
+        with self.lock:
+            for name, value in self.metrics.items():
+                metric = "covid_etl_{}".format(name)
+                kind = "counter" if name.endswith("_total") else "gauge"
+                lines.append("# TYPE {} {}".format(metric, kind))
+                lines.append("{} {}".format(metric, value))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host=DaemonConfig.HOST, port=DaemonConfig.PORT):
+        """Starts the health and metrics endpoint in a background thread
+
+        Args:
+            host (str, optional): interface to bind. Defaults to DaemonConfig.HOST.
+            port (int, optional): port to bind, 0 picks a free one. Defaults to DaemonConfig.PORT.
+
+        Returns:
+            ThreadingHTTPServer: the running server, server_port holds the bound port
+        """
+
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    health = daemon.health()
+                    body = json.dumps(health).encode("utf-8")
+                    status = 200 if health["status"] == "ok" else 503
+                    content_type = "application/json"
+                elif self.path == "/metrics":
+                    body = daemon.render_metrics().encode("utf-8")
+                    status = 200
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    body, status, content_type = b"not found", 404, "text/plain"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def run_forever(self, host=DaemonConfig.HOST, port=DaemonConfig.PORT):
+        """Serves the endpoint and polls on the interval until stop() is called
+        """
+
+        self.serve(host, port)
+        while not self.stop_event.is_set():
+            self.poll()
+            self.stop_event.wait(self.interval)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stop(self):
+        """Stops run_forever() after the current poll
+        """
+
+        self.stop_event.set()
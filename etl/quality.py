@@ -0,0 +1,183 @@
+import functools
+import threading
+import numpy as np
+import pandas as pd
+import pycountry
+
+from etl.constants import ETLConfigs
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_country(name):
+    """Finds the ISO country of a country name the way the dashboard does, exact lookup first then fuzzy search
+
+    Args:
+        name (str): standardized country name
+
+    Returns:
+        str: ISO 3166-1 alpha-3 code, None if the dashboard would show the country as N/A
+    """
+
+    try:
+        return pycountry.countries.lookup(name).alpha_3
+    except LookupError:
+        pass
+    try:
+        return pycountry.countries.search_fuzzy(name)[0].alpha_3
+    except LookupError:
+        return None
+
+
+class QualityChecker:
+    """ Class for validating and normalizing the sources as part of the transform, without extra passes over the long table
+
+    Payload and interface
+    ---------------------
+    Location checks run on the wide sources, one row per location, before they are unpivoted:
+    the USA total rows are dropped with a single mask and country names are resolved once per unique name.
+    Measure checks run on the arrays the transform already computes (daily deltas, measures aligned by region).
+    Every check appends a record, collected into the quality_report table once the run is loaded.
+
+    Checks
+    ------
+    us_total_rows -- USA total rows dropped from a source, as they are already in the usa dataset
+    renamed_countries -- country names standardized through ETLConfigs.COUNTRY_NAME_DICT
+    unresolved_countries -- countries without an ISO code, detail lists their names
+    negative_deltas -- daily values below zero (source corrections), detail holds the lowest
+    nan_values -- daily values missing from a source
+    missing_measures -- location days of a region a source has no value for, left empty once its measures are aligned
+    """
+
+    def __init__(self):
+        self.country_dict = ETLConfigs.COUNTRY_NAME_DICT
+        self.lock = threading.Lock()
+        self.records = []
+
+    def reset(self):
+        """Forgets the records of the previous run
+        """
+
+        with self.lock:
+            self.records = []
+
+    def record(self, source, check, count, detail=None):
+        """Adds a check result, only when something was found
+
+        Args:
+            source (str): source or measure checked
+            check (str): name of the check
+            count (int): number of values or rows concerned
+            detail (str, optional): example values. Defaults to None.
+        """
+
+        if count:
+            with self.lock:
+                self.records.append(
+                    {
+                        "source": source,
+                        "check_name": check,
+                        "count": int(count),
+                        "detail": detail,
+                    }
+                )
+
+    def summarize(self, values, limit=10):
+        """Lists the first values found by a check, keeping the report compact
+
+        Args:
+            values (list): values found
+            limit (int, optional): number of values listed. Defaults to 10.
+
+        Returns:
+            str: comma separated values
+        """
+
+        detail = ", ".join(str(v) for v in values[:limit])
+        if len(values) > limit:
+            detail += " (+{} more)".format(len(values) - limit)
+        return detail
+
+    def validate_locations(self, df, source):
+        """Drops the USA total rows and standardizes the country names of a wide source
+
+        Args:
+            df (pd.DataFrame): standardized wide source
+            source (str): key of the source in ETLConfigs.SOURCES
+
+        Returns:
+            pd.DataFrame: the validated source, the same DataFrame when no row was dropped
+        """
+
+        # the global dataset contains a daily USA total field which we do not want to include, as it is already in the usa dataset
+        # it is identified as a null in "state" column.
+        us_total = ((df["country"] == "US") & df["state"].isnull()).to_numpy()
+        if us_total.any():
+            df = df[~us_total]
+            self.record(source, "us_total_rows", us_total.sum())
+
+        # rename countries once per unique name, then broadcast the codes back
+        codes, names = pd.factorize(df["country"])
+        standardized = np.array(
+            [self.country_dict.get(n, n) for n in names], dtype=object
+        )
+        renamed = standardized != names.to_numpy(dtype=object)
+        if renamed.any():
+            countries = standardized[codes]
+            countries[codes < 0] = None
+            df["country"] = countries
+            self.record(
+                source,
+                "renamed_countries",
+                np.isin(codes, np.flatnonzero(renamed)).sum(),
+                self.summarize(sorted(names[renamed])),
+            )
+
+        unresolved = sorted(n for n in set(standardized) if resolve_country(n) is None)
+        self.record(
+            source, "unresolved_countries", len(unresolved), self.summarize(unresolved)
+        )
+        return df
+
+    def check_deltas(self, source, daily):
+        """Counts the negative and missing daily values of a source
+
+        Args:
+            source (str): key of the source in ETLConfigs.SOURCES
+            daily (np.ndarray): daily values, one row per location and one column per date
+        """
+
+        if daily.dtype.kind == "f":
+            missing = np.isnan(daily)
+            self.record(source, "nan_values", missing.sum())
+        negative = daily < 0
+        if negative.any():
+            self.record(
+                source, "negative_deltas", negative.sum(), str(np.nanmin(daily))
+            )
+
+    def check_measures(self, source, missing):
+        """Records the location days of a region missing from a source, counted while aligning the measures
+
+        Args:
+            source (str): key of the source in ETLConfigs.SOURCES
+            missing (int): number of location days of the region the source has no value for
+        """
+
+        self.record(source, "missing_measures", missing)
+
+    def report(self, load_time):
+        """Collects the records of the run
+
+        Args:
+            load_time (datetime): etl_load_time of the run
+
+        Returns:
+            pd.DataFrame: one row per finding, ready for the quality_report table
+        """
+
+        with self.lock:
+            df = pd.DataFrame(
+                self.records, columns=list(ETLConfigs.QUALITY_SQL_DTYPES)[1:]
+            )
+        df.insert(0, "etl_load_time", load_time)
+        return df
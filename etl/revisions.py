@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+from etl.constants import ETLConfigs
+
+
+class RevisionDetector:
+    """ Class for detecting which locations and dates of a source were revised since the last run
+
+    Payload and interface
+    ---------------------
+    Every location (row) of a standardized wide source DataFrame is hashed in blocks of date columns.
+    Blocks are aligned on the day ordinal, so a new day only ever touches the last block.
+    Comparing the hashes against the ones stored by the previous run gives, for every changed location,
+    the first and last day whose daily delta has to be recomputed.
+
+    A location is identified by its location columns, with an occurrence number for rows sharing them.
+    As the covid_daily table is keyed on every location column, a location whose coordinates change is a new location.
+    The days to recompute are keyed on the key columns of the source instead, which its region is aligned on
+    """
+
+    def __init__(self, block_days=ETLConfigs.REVISION_BLOCK_DAYS):
+        """
+        Args:
+            block_days (int, optional): number of date columns hashed together.
+                Defaults to ETLConfigs.REVISION_BLOCK_DAYS.
+        """
+
+        self.block_days = block_days
+        self.locations = ETLConfigs.LOCATION_COLUMNS
+
+    def location_keys(self, df, columns=None):
+        """Builds the key identifying each location of a standardized wide DataFrame.
+        Rows of the covid_daily table can not tell apart locations sharing the same location columns,
+        so these are revised together
+
+        Args:
+            df (pd.DataFrame): standardized wide source
+            columns (list, optional): location columns making the key. Defaults to every location column.
+
+        Returns:
+            pd.Series: key of each row, aligned with df
+        """
+
+        columns = df[columns if columns is not None else self.locations]
+        columns = columns.fillna("").astype(str)
+        return columns.iloc[:, 0].str.cat(columns.iloc[:, 1:], sep="|")
+
+    def hash_rows(self, df, columns):
+        """Hashes the given columns of every row
+
+        Args:
+            df (pd.DataFrame): standardized wide source
+            columns (list): date columns to hash
+
+        Returns:
+            np.ndarray: signed 64 bit hash of each row, as stored in SQLite
+        """
+
+        hashes = pd.util.hash_pandas_object(df[columns], index=False)
+        return hashes.to_numpy().view(np.int64)
+
+    def diff(self, source, df, dates, days, previous, key_columns=None):
+        """Hashes a source and compares it with the hashes of the previous run
+
+        Args:
+            source (str): key of the source in ETLConfigs.SOURCES
+            df (pd.DataFrame): standardized wide source
+            dates (list): date columns of df
+            days (np.ndarray): day ordinals of the date columns
+            previous (pd.DataFrame): hashes stored by the previous run, for all sources
+            key_columns (list, optional): location columns keying the ranges. Defaults to every location column.
+
+        Returns:
+            tuple: (hashes, changed_hashes, ranges)
+                hashes -- every block hash of the source
+                changed_hashes -- only the block hashes which differ from the previous run
+                ranges -- first_day and last_day to recompute, indexed by the location key of key_columns.
+                    None when the source can not be revised in place (first run, locations added or removed, days removed)
+        """
+
+        keys = self.location_keys(df)
+        occurrence = keys.groupby(keys).cumcount().astype(str)
+        locations = (keys + "#" + occurrence).to_numpy()
+        blocks = days // self.block_days
+
+        previous = previous[previous["source"] == source]
+        previous_blocks = {
+            block: group.set_index("location")
+            for block, group in previous.groupby("block")
+        }
+        structural_change = previous.empty or set(previous["location"]) != set(
+            locations
+        )
+
+        first_day = np.full(len(df), np.iinfo(np.int64).max)
+        last_day = np.full(len(df), -1)
+        all_hashes = []
+        changed_hashes = []
+        for block in np.unique(blocks):
+            in_block = blocks == block
+            block_dates = [d for d, keep in zip(dates, in_block) if keep]
+            block_days = days[in_block]
+            row_hash = self.hash_rows(df, block_dates)
+            block_hashes = pd.DataFrame(
+                {
+                    "source": source,
+                    "location": locations,
+                    "block": int(block),
+                    "n_days": len(block_dates),
+                    "row_hash": row_hash,
+                }
+            )
+            all_hashes.append(block_hashes)
+
+            stored = previous_blocks.get(block)
+            if stored is None:
+                # a block never seen before only holds new days
+                changed = np.ones(len(df), dtype=bool)
+                start = np.full(len(df), block_days[0])
+                changed_hashes.append(block_hashes)
+            else:
+                stored = stored.reindex(locations)
+                n_stored = int(stored["n_days"].max())
+                if n_stored > len(block_dates):
+                    structural_change = True
+                    n_stored = len(block_dates)
+                # when days were appended to the block, only the days seen before are compared
+                if n_stored < len(block_dates):
+                    compared = self.hash_rows(df, block_dates[:n_stored])
+                else:
+                    compared = row_hash
+                revised = compared != stored["row_hash"].to_numpy()
+                appended = n_stored < len(block_dates)
+                changed = revised | appended
+                start = np.where(revised, block_days[0], block_days[n_stored - 1] + 1)
+                changed_hashes.append(
+                    block_hashes[row_hash != stored["row_hash"].to_numpy()]
+                )
+            first_day = np.where(changed, np.minimum(first_day, start), first_day)
+            last_day = np.where(changed, np.maximum(last_day, block_days[-1]), last_day)
+
+        hashes = pd.concat(all_hashes, ignore_index=True)
+        changed_hashes = pd.concat(changed_hashes, ignore_index=True)
+        if structural_change:
+            return hashes, changed_hashes, None
+
+        # the daily delta of the day after a revised day changes as well
+        changed = last_day >= 0
+        last_day = np.minimum(last_day + 1, days.max())
+        ranges = (
+            pd.DataFrame(
+                {
+                    "location": self.location_keys(df, key_columns).to_numpy()[changed],
+                    "first_day": first_day[changed],
+                    "last_day": last_day[changed],
+                }
+            )
+            .groupby("location")
+            .agg({"first_day": "min", "last_day": "max"})
+        )
+        return hashes, changed_hashes, ranges
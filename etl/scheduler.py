@@ -0,0 +1,146 @@
+import datetime as dt
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from etl.constants import SchedulerConfig
+from etl.covid_daily import CovidPipeline
+from etl.worldpop import WorldPopPipepine
+from utils import RunStateUpdates
+
+
+def run_covid_daily():
+    """Runs the covid daily pipeline, reloading only the revised values when possible
+    """
+
+    CovidPipeline().run_incremental()
+
+
+def run_world_population():
+    """Runs the world population pipeline
+    """
+
+    WorldPopPipepine().run_pipeline()
+
+
+class PipelineScheduler:
+    """ Class for running only the pipelines whose data is due for a refresh
+
+    Payload and interface
+    ---------------------
+    The last successful run and the source fingerprint of each pipeline are tracked in the etl_state database.
+    A pipeline is skipped while its last success is younger than its TTL,
+    or when the fingerprint of its sources (HTTP validators) did not change since the last success.
+    Due pipelines run concurrently, each with its own DB connections.
+
+    Pipeline
+    --------
+    1. Check
+        i) Skip pipelines still within their TTL
+        ii) Skip pipelines whose source fingerprint is unchanged
+    2. Run
+        i) Run the due pipelines concurrently
+    3. Record
+        i) Store the run time and fingerprint of the pipelines that succeeded
+    """
+
+    def __init__(
+        self, force=False, state=None, timeout=SchedulerConfig.REQUEST_TIMEOUT_SECONDS
+    ):
+        """
+        Args:
+            force (bool, optional): run every pipeline regardless of freshness. Defaults to False.
+            state (RunStateUpdates, optional): run state store. Defaults to None, the etl_state database.
+            timeout (float, optional): seconds to wait for each source to answer. Defaults to SchedulerConfig.REQUEST_TIMEOUT_SECONDS.
+        """
+
+        self.force = force
+        self.state = state if state is not None else RunStateUpdates()
+        self.timeout = timeout
+        self.ttl_hours = SchedulerConfig.TTL_HOURS
+        self.source_urls = SchedulerConfig.SOURCE_URLS
+        self.fingerprint_headers = SchedulerConfig.FINGERPRINT_HEADERS
+        self.pipelines = {
+            "covid_daily": run_covid_daily,
+            "world_population": run_world_population,
+        }
+
+    def fingerprint(self, urls):
+        """Fingerprints the sources of a pipeline from their HTTP validators, without downloading them
+
+        Args:
+            urls (list): source urls of the pipeline
+
+        Returns:
+            str: hex digest of the validators, None if a source does not provide any or can not be reached
+        """
+
+        digest = hashlib.sha1()
+        with requests.Session() as s:
+            for url in urls:
+                try:
+                    headers = s.head(
+                        url, allow_redirects=True, timeout=self.timeout
+                    ).headers
+                except requests.RequestException:
+                    return None
+                validators = [
+                    headers.get(name, "") for name in self.fingerprint_headers
+                ]
+                if not any(validators):
+                    return None
+                digest.update("|".join([url] + validators).encode("utf-8"))
+        return digest.hexdigest()
+
+    def check(self, state, name, now):
+        """Decides whether a pipeline is due
+
+        Args:
+            state (RunStateUpdates): run state store
+            name (str): name of the pipeline
+            now (datetime): time of the check
+
+        Returns:
+            tuple: (status, fingerprint), status is one of "due", "fresh" or "unchanged"
+        """
+
+        last_success, last_fingerprint = state.read_state(name)
+        if self.force or last_success is None:
+            return "due", self.fingerprint(self.source_urls[name])
+        if now - last_success < dt.timedelta(hours=self.ttl_hours[name]):
+            return "fresh", last_fingerprint
+        fingerprint = self.fingerprint(self.source_urls[name])
+        if fingerprint is not None and fingerprint == last_fingerprint:
+            return "unchanged", fingerprint
+        return "due", fingerprint
+
+    def run(self):
+        """Runs the due pipelines concurrently
+
+        Returns:
+            dictionary: pipeline name as key, one of "fresh", "unchanged", "success" or the raised exception as value
+        """
+
+        now = dt.datetime.now()
+        results, due = {}, {}
+        with self.state as state:
+            for name in self.pipelines:
+                status, fingerprint = self.check(state, name, now)
+                if status == "due":
+                    due[name] = fingerprint
+                else:
+                    results[name] = status
+                    # the data was confirmed to match the source, so it is fresh again
+                    if status == "unchanged":
+                        state.record_success(name, fingerprint, now)
+
+            with ThreadPoolExecutor(max_workers=max(len(due), 1)) as executor:
+                futures = {name: executor.submit(self.pipelines[name]) for name in due}
+            for name, future in futures.items():
+                error = future.exception()
+                if error is None:
+                    state.record_success(name, due[name], now)
+                    results[name] = "success"
+                else:
+                    results[name] = error
+        return results
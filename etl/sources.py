@@ -0,0 +1,130 @@
+from etl.constants import ETLConfigs
+
+
+class SourceRegistry:
+    """ Class for the time series loaded by the covid pipeline, each one declaring where it comes from and what it holds
+
+    Payload and interface
+    ---------------------
+    Every source has the url of its csv, the region it covers, the measure it holds and the key columns
+    identifying its locations, shared by every source of its region. Sources of the same region are aligned on their shared location and day axis,
+    then unpivoted together into one row per location and day with a column per measure,
+    so a new series costs its own download and transform rather than a join over the whole long table.
+    Sources are read from ETLConfigs.SOURCES, more can be registered before the pipeline runs:
+        registry = SourceRegistry()
+        registry.register("tested_usa", url, region="usa", measure="tested")
+        CovidPipeline(sources=registry).run_pipeline()
+    """
+
+    def __init__(self, sources=None):
+        """
+        Args:
+            sources (dict, optional): source name as key, its url, region, measure and key_columns as value.
+                Defaults to ETLConfigs.SOURCES.
+        """
+
+        self.sources = {}
+        if sources is None:
+            sources = ETLConfigs.SOURCES
+        for name, source in sources.items():
+            self.register(name, **source)
+
+    def register(self, name, url, region, measure, key_columns=None):
+        """Adds a source, or replaces the source of the same name
+
+        Args:
+            name (str): name of the source, also used in the source hashes and the quality report
+            url (str): url of the csv file
+            region (str): region covered by the source, e.g. global or usa
+            measure (str): column of the covid_daily table filled by the source
+            key_columns (list, optional): location columns identifying a location of the source,
+                the same for every source of the region. Defaults to ETLConfigs.LOCATION_COLUMNS.
+        """
+
+        if measure in ETLConfigs.LOCATION_COLUMNS or measure == "date":
+            raise ValueError("{} can not be used as a measure".format(measure))
+        key_columns = list(
+            key_columns if key_columns is not None else ETLConfigs.LOCATION_COLUMNS
+        )
+        if not key_columns or not set(key_columns) <= set(ETLConfigs.LOCATION_COLUMNS):
+            raise ValueError(
+                "key columns of {} must be location columns: {}".format(
+                    name, key_columns
+                )
+            )
+        for other, source in self.sources.items():
+            if other == name or source["region"] != region:
+                continue
+            if source["measure"] == measure:
+                raise ValueError(
+                    "{} already holds the {} measure of {}".format(
+                        other, measure, region
+                    )
+                )
+            # the measures of a region are aligned on their locations
+            if source["key_columns"] != key_columns:
+                raise ValueError(
+                    "{} keys the locations of {} on {}, not {}".format(
+                        other, region, source["key_columns"], key_columns
+                    )
+                )
+        self.sources[name] = {
+            "url": url,
+            "region": region,
+            "measure": measure,
+            "key_columns": key_columns,
+        }
+
+    def names(self):
+        """
+        Returns:
+            list: name of every source, in registration order
+        """
+
+        return list(self.sources)
+
+    def url(self, name):
+        """
+        Returns:
+            str: url of the csv file of a source
+        """
+
+        return self.sources[name]["url"]
+
+    def measure(self, name):
+        """
+        Returns:
+            str: measure column filled by a source
+        """
+
+        return self.sources[name]["measure"]
+
+    def key_columns(self, name):
+        """
+        Returns:
+            list: location columns identifying a location of a source
+        """
+
+        return self.sources[name]["key_columns"]
+
+    def groups(self):
+        """Groups the sources aligned together
+
+        Returns:
+            dictionary: region as key, measure name and source name of the region as value
+        """
+
+        groups = {}
+        for name, source in self.sources.items():
+            groups.setdefault(source["region"], {})[source["measure"]] = name
+        return groups
+
+    def measures(self):
+        """
+        Returns:
+            list: every measure column, in registration order
+        """
+
+        return list(
+            dict.fromkeys(source["measure"] for source in self.sources.values())
+        )
@@ -3,9 +3,8 @@
 
 import csv
 import requests
-from bs4 import BeautifulSoup
+import lxml.html
 import pandas as pd
-import numpy as np
 
 pd.options.mode.chained_assignment = None
 
@@ -24,70 +23,122 @@ class WorldPopPipepine:
     Pipeline
     --------
     1. Setup
-        i) Drop existing tables if exist
+        i) Drop the staging table if it exists
     2. Extract
-        i) Scrape table data from source with BeautifulSoup
+        i) Scrape table data from source with a targeted XPath pass, parsing numbers as it goes
     3. Transform
         i) Transform and clearn column headers
     4. Load
-        i) Insert DataFrame into the database
+        i) Insert DataFrame into the staging table
     5. Teardown
-        i) None
+        i) Swap staging into the live table, so a failed scrape leaves the previous data in place
     """
 
-    def __init__(self, worldpopdb=WorldPopUpdates()):
-        # Payload and sql interface
-        self.database = worldpopdb
+    def __init__(self, worldpopdb=None):
+        # Payload and sql interface, the connection is only opened once a run starts
+        self.database = worldpopdb if worldpopdb is not None else WorldPopUpdates()
         self.body = pd.DataFrame()
 
         # Static properties
         self.source_url = WorldPopConfig.POP_URL
         self.header_dict = WorldPopConfig.HEADER_DICT
+        self.text_columns = WorldPopConfig.TEXT_COLUMNS
+        self.encoding = WorldPopConfig.POP_ENCODING
         self.country_dict = WorldPopConfig.COUNTRY_NAME_DICT
 
     def setup(self):
-        """Drop existin table if exists
+        """Drop the staging table if exists
         """
 
-        self.database.drop_existing_table()
+        self.database.drop_staging_table()
+
+    def parse_table(self, content):
+        """Pull the rows of the population table straight into column arrays, without serializing the markup back
+
+        Args:
+            content (bytes): html of the source page
+
+        Raises:
+            ValueError: when a row does not have one cell per header
+
+        Returns:
+            pd.DataFrame: one column per table header, numeric columns already parsed
+        """
+
+        parser = lxml.html.HTMLParser(encoding=self.encoding)
+        table = lxml.html.fromstring(content, parser=parser).xpath("(//table)[1]")[0]
+        headers = [
+            " ".join(th.text_content().split()) for th in table.xpath(".//thead//th")
+        ]
+        rows = [
+            [td.text_content().strip() for td in tr.xpath("./td")]
+            for tr in table.xpath(".//tbody/tr")
+        ]
+        for i, row in enumerate(rows):
+            if len(row) != len(headers):
+                raise ValueError(
+                    f"Row {i} of the population table has {len(row)} cells for {len(headers)} headers"
+                )
+        df = pd.DataFrame(dict(zip(headers, zip(*rows))))
+        for column in df.columns:
+            if column not in self.text_columns:
+                df[column] = self.parse_numeric(df[column])
+        return df
+
+    def parse_numeric(self, column):
+        """Convert a column of formatted numbers ("1,234", "1.02 %") to numbers, 'N.A.' becomes np.NaN
+
+        Args:
+            column (pd.Series): column of strings scraped from the table
+
+        Returns:
+            pd.Series: numeric column
+        """
+
+        cleaned = (
+            column.str.replace(",", "", regex=False)
+            .str.replace("%", "", regex=False)
+            .str.strip()
+        )
+        return pd.to_numeric(cleaned, errors="coerce")
 
     def extract(self):
-        """Scrape the web data using BeautifulSoup, read content into a pd.DataFrame
+        """Scrape the web data with parse_table(), read content into a pd.DataFrame
         """
 
         response = requests.get(self.source_url)
-        data = BeautifulSoup(response.content, features="lxml").find_all("table")
-
-        self.body = pd.read_html(str(data))[0]
+        self.body = self.parse_table(response.content)
 
     def transform(self):
         """Rename the columns appropriately to remove blank spaces and special characters
-            Also replaces 'N.A.' stored as string with np.NaN, and properly renames some country names
-            so that pycountry library will be able to find
+            Also properly renames some country names so that pycountry library will be able to find
         """
 
         self.body.rename(columns=self.header_dict, inplace=True)
-        self.body.replace({"N.A.": np.NaN}, inplace=True)
         country = (
             self.body["country"].map(self.country_dict).fillna(self.body["country"])
         )
         self.body["country"] = country
 
     def load(self):
-        """Insert DataFrame into database
+        """Insert DataFrame into the staging table
         """
 
         self.database.create_insert_table(self.body)
 
     def teardown(self):
-        pass
+        """Swap the staging table into the live table
+        """
+
+        self.database.swap_tables()
 
     def run_pipeline(self):
-        """Defines pipeline steps
+        """Defines pipeline steps, each run opens and closes its own database connection
         """
 
-        self.setup()
-        self.extract()
-        self.transform()
-        self.load()
-        self.teardown()
+        with self.database:
+            self.setup()
+            self.extract()
+            self.transform()
+            self.load()
+            self.teardown()
@@ -1,18 +1,51 @@
-import etl.covid_daily
-import etl.worldpop
-import os.path
-from utils import project_root
-from etl.constants import WorldPopConfig
+import argparse
+import sys
+
+from etl.constants import DaemonConfig
+from etl.scheduler import PipelineScheduler
 
 if __name__ == "__main__":
 
-    # Check if database exsit and whether to download population db
-    # root_path = project_root()
-    # db = WorldPopConfig.DB_NAME
-    # if os.path.isfile(f"{root_path}/{db}.db") == False:
-    run_worldpop = etl.worldpop.WorldPopPipepine()
-    run_worldpop.run_pipeline()
+    parser = argparse.ArgumentParser(
+        description="Refresh the covid and population databases whose data is due"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run every pipeline, even if its data is still fresh",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep the covid pipeline running, polling its sources until interrupted",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DaemonConfig.POLL_SECONDS,
+        help="seconds between polls in daemon mode",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DaemonConfig.PORT,
+        help="port of the /health and /metrics endpoint in daemon mode",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        from etl.daemon import ETLDaemon
+
+        daemon = ETLDaemon(interval=args.interval)
+        try:
+            daemon.run_forever(port=args.port)
+        except KeyboardInterrupt:
+            daemon.stop()
+        sys.exit(0)
 
-    # Run covid daily update
-    run_etl = etl.covid_daily.CovidPipeline()
-    run_etl.run_pipeline()
+    # Skip the pipelines whose data is still fresh, run the others concurrently
+    results = PipelineScheduler(force=args.force).run()
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    if any(isinstance(result, Exception) for result in results.values()):
+        sys.exit(1)
@@ -0,0 +1,58 @@
+CREATE TEMP TABLE grid_deltas AS
+SELECT  latitude,
+        longitude,
+        SUM(confirmed) AS confirmed,
+        SUM(death) AS death
+FROM (
+    SELECT  latitude, longitude, confirmed, death
+    FROM covid_daily_revised
+    UNION ALL
+    SELECT  c.latitude, c.longitude, -c.confirmed, -c.death
+    FROM covid_daily_revised r
+    JOIN covid_daily c
+      ON c.date = r.date
+     AND c.country IS r.country
+     AND c.state IS r.state
+     AND c.latitude IS r.latitude
+     AND c.longitude IS r.longitude
+)
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+GROUP BY latitude, longitude ;
+
+DELETE FROM covid_daily
+WHERE rowid IN (
+    SELECT  c.rowid
+    FROM covid_daily_revised r
+    JOIN covid_daily c
+      ON c.date = r.date
+     AND c.country IS r.country
+     AND c.state IS r.state
+     AND c.latitude IS r.latitude
+     AND c.longitude IS r.longitude
+);
+
+INSERT INTO covid_daily ({columns})
+SELECT  {columns}
+FROM covid_daily_revised ;
+
+INSERT INTO covid_changelog
+SELECT  etl_load_time,
+        country,
+        state,
+        latitude,
+        longitude,
+        MIN(date) AS date_from,
+        MAX(date) AS date_to,
+        COUNT(*) AS rows_rewritten
+FROM covid_daily_revised
+GROUP BY etl_load_time, country, state, latitude, longitude ;
+
+INSERT OR REPLACE INTO source_hashes (source, location, block, n_days, row_hash)
+SELECT  source, location, block, n_days, row_hash
+FROM source_hashes_revised ;
+
+{grid_revisions}
+
+DROP TABLE covid_daily_revised;
+DROP TABLE source_hashes_revised;
+DROP TABLE temp.grid_deltas;
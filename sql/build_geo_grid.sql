@@ -0,0 +1,23 @@
+INSERT INTO {target_table}
+SELECT  {zoom} AS zoom,
+        cell_row,
+        cell_col,
+        cell_row * {cell_degrees} - 90 AS lat_min,
+        (cell_row + 1) * {cell_degrees} - 90 AS lat_max,
+        cell_col * {cell_degrees} - 180 AS lon_min,
+        (cell_col + 1) * {cell_degrees} - 180 AS lon_max,
+        AVG(latitude) AS latitude,
+        AVG(longitude) AS longitude,
+        COUNT(*) AS locations,
+        SUM(confirmed) AS confirmed,
+        SUM(death) AS death
+FROM (
+    SELECT  MIN(CAST((latitude + 90) / {cell_degrees} AS INTEGER), {max_row}) AS cell_row,
+            MIN(CAST((longitude + 180) / {cell_degrees} AS INTEGER), {max_col}) AS cell_col,
+            latitude,
+            longitude,
+            confirmed,
+            death
+    FROM temp.grid_locations
+)
+GROUP BY cell_row, cell_col ;
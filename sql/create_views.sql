@@ -1,16 +1,10 @@
-DROP VIEW IF EXISTS country_daily;
-DROP VIEW IF EXISTS country_overall;
-DROP VIEW IF EXISTS state_daily;
-DROP VIEW IF EXISTS state_overall;
-DROP VIEW IF EXISTS log_lat_daily;
-DROP VIEW IF EXISTS log_lat_overall;
-
 CREATE VIEW country_daily
     AS
     SELECT  country,
             date,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY country, date ;;
 
@@ -18,7 +12,8 @@ CREATE VIEW country_overall
     AS
     SELECT  country,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY country ;;
 
@@ -28,7 +23,8 @@ CREATE VIEW state_daily
             state,
             date,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY country, state, date ;;
 
@@ -37,7 +33,8 @@ CREATE VIEW state_overall
     SELECT  country,
             state,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY country, state ;;
 
@@ -47,7 +44,8 @@ CREATE VIEW log_lat_daily
             latitude,
             date,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY longitude, latitude, date ;;
 
@@ -56,6 +54,7 @@ CREATE VIEW log_lat_overall
     SELECT  longitude,
             latitude,
             SUM(confirmed) AS confirmed,
-            SUM(death) AS death
+            SUM(death) AS death,
+            SUM(recovered) AS recovered
     FROM covid_daily
     GROUP BY longitude, latitude ;;
@@ -0,0 +1,9 @@
+DROP TABLE IF EXISTS temp.grid_locations;
+CREATE TEMP TABLE grid_locations AS
+SELECT  latitude,
+        longitude,
+        SUM(confirmed) AS confirmed,
+        SUM(death) AS death
+FROM {source_table}
+WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+GROUP BY latitude, longitude ;
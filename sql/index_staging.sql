@@ -0,0 +1,2 @@
+CREATE INDEX covid_daily_date_idx_{suffix} ON covid_daily_new (date);
+CREATE INDEX geo_grid_bbox_idx_{suffix} ON geo_grid_new (zoom, lat_min, lon_min);
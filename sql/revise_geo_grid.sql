@@ -0,0 +1,16 @@
+UPDATE geo_grid
+SET     confirmed = CASE WHEN d.confirmed IS NULL THEN geo_grid.confirmed
+                         ELSE COALESCE(geo_grid.confirmed, 0) + d.confirmed END,
+        death = CASE WHEN d.death IS NULL THEN geo_grid.death
+                     ELSE COALESCE(geo_grid.death, 0) + d.death END
+FROM (
+    SELECT  MIN(CAST((latitude + 90) / {cell_degrees} AS INTEGER), {max_row}) AS cell_row,
+            MIN(CAST((longitude + 180) / {cell_degrees} AS INTEGER), {max_col}) AS cell_col,
+            SUM(confirmed) AS confirmed,
+            SUM(death) AS death
+    FROM temp.grid_deltas
+    GROUP BY 1, 2
+) AS d
+WHERE geo_grid.zoom = {zoom}
+  AND geo_grid.cell_row = d.cell_row
+  AND geo_grid.cell_col = d.cell_col ;
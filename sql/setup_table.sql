@@ -4,8 +4,84 @@ CREATE TABLE IF NOT EXISTS covid_daily
     state           TEXT,
     latitude        REAL,
     longitude       REAL,
-    date            TEXT,
+    date            INTEGER,
     confirmed       INTEGER,
     death           INTEGER,
+    recovered       INTEGER,
     etl_load_time   TEXT
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS geo_grid
+(
+    zoom            INTEGER,
+    cell_row        INTEGER,
+    cell_col        INTEGER,
+    lat_min         REAL,
+    lat_max         REAL,
+    lon_min         REAL,
+    lon_max         REAL,
+    latitude        REAL,
+    longitude       REAL,
+    locations       INTEGER,
+    confirmed       INTEGER,
+    death           INTEGER
+);
+
+DROP TABLE IF EXISTS geo_grid_new;
+CREATE TABLE geo_grid_new
+(
+    zoom            INTEGER,
+    cell_row        INTEGER,
+    cell_col        INTEGER,
+    lat_min         REAL,
+    lat_max         REAL,
+    lon_min         REAL,
+    lon_max         REAL,
+    latitude        REAL,
+    longitude       REAL,
+    locations       INTEGER,
+    confirmed       INTEGER,
+    death           INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS source_hashes
+(
+    source          TEXT,
+    location        TEXT,
+    block           INTEGER,
+    n_days          INTEGER,
+    row_hash        INTEGER,
+    PRIMARY KEY (source, location, block)
+);
+
+DROP TABLE IF EXISTS source_hashes_new;
+CREATE TABLE source_hashes_new
+(
+    source          TEXT,
+    location        TEXT,
+    block           INTEGER,
+    n_days          INTEGER,
+    row_hash        INTEGER,
+    PRIMARY KEY (source, location, block)
+);
+
+CREATE TABLE IF NOT EXISTS covid_changelog
+(
+    etl_load_time   TEXT,
+    country         TEXT,
+    state           TEXT,
+    latitude        REAL,
+    longitude       REAL,
+    date_from       INTEGER,
+    date_to         INTEGER,
+    rows_rewritten  INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS quality_report
+(
+    etl_load_time   TEXT,
+    source          TEXT,
+    check_name      TEXT,
+    count           INTEGER,
+    detail          TEXT
+);
@@ -1,5 +1,12 @@
-BEGIN TRANSACTION;
-ALTER TABLE covid_daily RENAME TO covid_daily_old;
+DROP VIEW IF EXISTS country_daily;
+DROP VIEW IF EXISTS country_overall;
+DROP VIEW IF EXISTS state_daily;
+DROP VIEW IF EXISTS state_overall;
+DROP VIEW IF EXISTS log_lat_daily;
+DROP VIEW IF EXISTS log_lat_overall;
+DROP TABLE IF EXISTS covid_daily;
 ALTER TABLE covid_daily_new RENAME TO covid_daily;
-DROP TABLE IF EXISTS covid_daily_old;
-END TRANSACTION;
\ No newline at end of file
+DROP TABLE IF EXISTS geo_grid;
+ALTER TABLE geo_grid_new RENAME TO geo_grid;
+DROP TABLE IF EXISTS source_hashes;
+ALTER TABLE source_hashes_new RENAME TO source_hashes;
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the dashboard modules import each other as top level modules, as under `streamlit run`
+sys.path.insert(0, os.path.join(ROOT, "dashboards"))
+sys.path.insert(0, ROOT)
+
+from utils import DBUpdates
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A DBUpdates writing covid_master.db to a temporary directory
+    """
+
+    database = DBUpdates()
+    database.project_root = str(tmp_path)
+    return database
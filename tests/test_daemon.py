@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from etl.covid_daily import CovidPipeline
+from etl.daemon import ETLDaemon
+from etl.sources import SourceRegistry
+
+STALL_SECONDS = 5.0
+TIMEOUT_SECONDS = 0.5
+
+
+class StalledHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(STALL_SECONDS)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stalled():
+    """A source which accepts connections but never answers in time
+
+    Yields:
+        str: url of the source
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StalledHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}/source.csv".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def read_health(daemon):
+    server = daemon.serve(port=0)
+    try:
+        url = "http://127.0.0.1:{}/health".format(server.server_port)
+        try:
+            with urllib.request.urlopen(url) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stalled_source_fails_the_poll(stalled):
+    sources = SourceRegistry(
+        {
+            "confirmed_global": {
+                "url": stalled,
+                "region": "global",
+                "measure": "confirmed",
+            }
+        }
+    )
+    daemon = ETLDaemon(CovidPipeline(sources=sources), timeout=TIMEOUT_SECONDS)
+
+    start = time.monotonic()
+    assert not daemon.poll()
+    assert time.monotonic() - start < STALL_SECONDS
+    assert "Timeout" in daemon.last_error
+    assert daemon.metrics["errors_total"] == 1
+    status, health = read_health(daemon)
+    assert status == 503 and health["status"] == "error"
+
+
+def test_health_turns_stale_without_a_recent_success():
+    daemon = ETLDaemon(CovidPipeline(), interval=60)
+    status, health = read_health(daemon)
+    assert status == 200 and health["status"] == "ok" and not health["stale"]
+
+    # a poll succeeded three intervals ago, and none since
+    daemon.metrics["last_success_timestamp_seconds"] = time.time() - 180
+    daemon.started = time.time() - 600
+    status, health = read_health(daemon)
+    assert status == 503 and health["status"] == "error" and health["stale"]
+    assert health["last_error"] is None
@@ -0,0 +1,164 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import geogrid
+from synthetic import publish_body, synthetic_body
+from etl.constants import ETLConfigs
+from utils import DBUpdates
+
+ZOOM_LEVELS = ETLConfigs.GRID_CELL_DEGREES
+
+
+def random_locations(n, seed=0):
+    """Random locations, plus the poles and the antimeridian which the grid clamps into its last row and column
+    """
+
+    rng = np.random.RandomState(seed)
+    edges = [(90.0, 0.0), (-90.0, 0.0), (0.0, 180.0), (0.0, -180.0), (90.0, 180.0)]
+    latitude = np.concatenate([rng.uniform(-90, 90, n), [lat for lat, _ in edges]])
+    longitude = np.concatenate([rng.uniform(-180, 180, n), [lon for _, lon in edges]])
+    return pd.DataFrame(
+        {
+            "country": [f"C{i}" for i in range(len(latitude))],
+            "state": None,
+            "latitude": latitude.round(4),
+            "longitude": longitude.round(4),
+        }
+    )
+
+
+def cell_of(latitude, longitude, cell_degrees):
+    """Brute force cell of a location, clamped as in sql/build_geo_grid.sql
+    """
+
+    max_row = int(round(180 / cell_degrees)) - 1
+    max_col = int(round(360 / cell_degrees)) - 1
+    row = min(int((latitude + 90) / cell_degrees), max_row)
+    col = min(int((longitude + 180) / cell_degrees), max_col)
+    return row, col
+
+
+def in_bbox(latitude, longitude, bbox):
+    south, west, north, east = bbox
+    in_lon = (
+        west <= longitude <= east
+        if west <= east
+        else (longitude >= west or longitude <= east)
+    )
+    return south <= latitude <= north and in_lon
+
+
+def random_bboxes(n, seed=0):
+    rng = np.random.RandomState(seed)
+    bboxes = [
+        (-90, -180, 90, 180),
+        (85, -10, 90, 10),
+        (-90, 170, -80, -170),
+        (-10, 175, 10, -175),
+        (89.5, 179.5, 90, 180),
+    ]
+    for _ in range(n):
+        south, north = sorted(rng.uniform(-90, 90, 2))
+        west, east = rng.uniform(-180, 180, 2)
+        bboxes.append((south, west, north, east))
+    return bboxes
+
+
+@pytest.fixture(scope="module")
+def grid(tmp_path_factory):
+    database = DBUpdates()
+    database.project_root = str(tmp_path_factory.mktemp("grid"))
+    locations = random_locations(2000)
+    publish_body(database, synthetic_body(locations, n_days=2))
+    conn = sqlite3.connect(f"{database.project_root}/covid_master.db")
+    yield conn, locations
+    conn.close()
+
+
+def grid_cells(conn, zoom, bbox):
+    """Cells returned for a viewport, as (row, col) from their centroid
+    """
+
+    df = pd.read_sql_query(geogrid.cells_query(zoom, bbox), conn)
+    cell_degrees = ZOOM_LEVELS[zoom]
+    return (
+        {
+            cell_of(lat, lon, cell_degrees)
+            for lat, lon in zip(df.latitude, df.longitude)
+        },
+        df,
+    )
+
+
+@pytest.mark.parametrize("zoom", sorted(ZOOM_LEVELS))
+def test_cells_match_brute_force(grid, zoom):
+    conn, locations = grid
+    cell_degrees = ZOOM_LEVELS[zoom]
+    cells = [
+        cell_of(lat, lon, cell_degrees)
+        for lat, lon in zip(locations.latitude, locations.longitude)
+    ]
+    for bbox in random_bboxes(50, seed=zoom):
+        south, west, north, east = bbox
+        expected = set()
+        for row, col in cells:
+            lat_min, lon_min = row * cell_degrees - 90, col * cell_degrees - 180
+            lat_max, lon_max = lat_min + cell_degrees, lon_min + cell_degrees
+            in_lat = lat_min <= north and lat_max >= south
+            if west <= east:
+                in_lon = lon_max >= west and lon_min <= east
+            else:
+                in_lon = lon_max >= west or lon_min <= east
+            if in_lat and in_lon:
+                expected.add((row, col))
+        returned, _ = grid_cells(conn, zoom, bbox)
+        assert returned == expected, bbox
+
+        # every location in view is counted in a returned cell
+        for lat, lon, cell in zip(locations.latitude, locations.longitude, cells):
+            if in_bbox(lat, lon, bbox):
+                assert cell in returned, (bbox, lat, lon)
+
+
+def test_poles_and_antimeridian_are_clamped(grid):
+    conn, _ = grid
+    for zoom, cell_degrees in ZOOM_LEVELS.items():
+        max_row = int(round(180 / cell_degrees)) - 1
+        max_col = int(round(360 / cell_degrees)) - 1
+        rows = conn.execute(
+            "SELECT MAX(cell_row), MAX(cell_col), MIN(lat_min), MAX(lat_max), MIN(lon_min), MAX(lon_max) "
+            "FROM geo_grid WHERE zoom = ?",
+            (zoom,),
+        ).fetchone()
+        assert rows[0] == max_row and rows[1] == max_col
+        assert rows[2] >= -90 and rows[3] <= 90 and rows[4] >= -180 and rows[5] <= 180
+
+    # the corner location at (90, 180) falls in the last cell, found from either side of the antimeridian
+    for bbox in [(89.9, 179.9, 90, 180), (89.9, 179.9, 90, -179.9)]:
+        _, df = grid_cells(conn, max(ZOOM_LEVELS), bbox)
+        assert ((df.latitude == 90.0) & (df.longitude == 180.0)).any()
+
+
+def test_world_view_counts_every_location(grid):
+    conn, locations = grid
+    for zoom in ZOOM_LEVELS:
+        _, df = grid_cells(conn, zoom, (-90, -180, 90, 180))
+        assert df["locations"].sum() == len(locations)
+
+
+def test_pick_zoom_stays_under_the_cell_budget():
+    for bbox in random_bboxes(100, seed=1):
+        zoom = geogrid.pick_zoom(bbox, ZOOM_LEVELS, max_cells=2000)
+        south, west, north, east = bbox
+        lon_span = east - west if west <= east else 360 - (west - east)
+        cell_degrees = ZOOM_LEVELS[zoom]
+        n_cells = ((north - south) / cell_degrees + 1) * (lon_span / cell_degrees + 1)
+        finer = [z for z in ZOOM_LEVELS if ZOOM_LEVELS[z] < cell_degrees]
+        # the coarsest level is used when nothing fits, otherwise the finest level which fits
+        assert n_cells <= 2000 or zoom == min(ZOOM_LEVELS)
+        for level in finer:
+            d = ZOOM_LEVELS[level]
+            assert ((north - south) / d + 1) * (lon_span / d + 1) > 2000
@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from synthetic import publish_body, synthetic_body
+
+# a query stalled longer than this means the publish blocked the readers
+MAX_STALL_SECONDS = 1.0
+
+
+def locations(n=500):
+    return pd.DataFrame(
+        {
+            "country": [f"C{i % 50}" for i in range(n)],
+            "state": [f"S{i}" for i in range(n)],
+            "latitude": [(i * 7.3) % 170 - 85 for i in range(n)],
+            "longitude": [(i * 13.1) % 350 - 175 for i in range(n)],
+        }
+    )
+
+
+def test_readers_see_no_errors_during_publish(database):
+    publish_body(database, synthetic_body(locations(), n_days=60, seed=0))
+    path = f"{database.project_root}/covid_master.db"
+    expected = (
+        sqlite3.connect(path).execute("SELECT COUNT(*) FROM covid_daily").fetchone()[0]
+    )
+
+    stop = threading.Event()
+    errors, stalls, counts = [], [], []
+
+    def reader():
+        conn = sqlite3.connect(path, timeout=5)
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                conn.execute("SELECT COUNT(*) FROM country_overall").fetchall()
+                conn.execute("SELECT COUNT(*) FROM geo_grid").fetchall()
+                counts.append(
+                    conn.execute("SELECT COUNT(*) FROM covid_daily").fetchone()[0]
+                )
+            except sqlite3.Error as error:
+                errors.append(repr(error))
+            stalls.append(time.perf_counter() - start)
+        conn.close()
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        for seed in range(1, 6):
+            publish_body(database, synthetic_body(locations(), n_days=60, seed=seed))
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+    assert errors == []
+    assert len(counts) > 0
+    # readers only ever see a whole published table, never an empty or missing one
+    assert set(counts) == {expected}
+    assert max(stalls) < MAX_STALL_SECONDS
+
+
+def test_publish_uses_wal(database):
+    publish_body(database, synthetic_body(locations(50), n_days=5))
+    conn = sqlite3.connect(f"{database.project_root}/covid_master.db")
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    views = {
+        name
+        for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")
+    }
+    assert views == {
+        "country_daily",
+        "country_overall",
+        "state_daily",
+        "state_overall",
+        "log_lat_daily",
+        "log_lat_overall",
+    }
@@ -0,0 +1,56 @@
+import contextlib
+import sqlite3
+
+import pandas as pd
+
+from test_sources import (
+    N_DAYS,
+    N_GLOBAL,
+    N_USA,
+    pipeline,
+    registry,
+    served,
+    write_sources,
+)
+
+
+def quality_report(pipeline):
+    path = f"{pipeline.database.project_root}/covid_master.db"
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        df = pd.read_sql_query("SELECT * FROM quality_report", conn)
+    return df.set_index(["source", "check_name"])
+
+
+def test_quality_report_of_a_run(served, tmp_path):
+    directory, url = served
+    # a correction of the confirmed series, which its next day gives back
+    write_sources(directory, revise=(5, 40))
+    covid = pipeline(tmp_path / "covid", registry(url))
+    covid.run_pipeline()
+    report = quality_report(covid)
+
+    for source in ["confirmed_global", "death_global"]:
+        assert report.loc[(source, "us_total_rows"), "count"] == 1
+        assert report.loc[(source, "renamed_countries"), "count"] == 1
+        assert report.loc[(source, "renamed_countries"), "detail"] == "Burma"
+        assert report.loc[(source, "negative_deltas"), "count"] == 1
+    assert report.loc[("confirmed_global", "negative_deltas"), "detail"] == "-5"
+    for source in ["confirmed_usa", "death_usa"]:
+        assert report.loc[(source, "renamed_countries"), "count"] == N_USA
+        assert report.loc[(source, "renamed_countries"), "detail"] == "US"
+
+    # Canada only has recovered values, for every day but the last
+    for source in ["confirmed_global", "death_global"]:
+        assert report.loc[(source, "missing_measures"), "count"] == N_DAYS - 1
+    # recovered misses the first ten locations, one of them the dropped USA total,
+    # and lags a day behind the other locations
+    assert report.loc[("recovered_global", "missing_measures"), "count"] == (
+        (10 - 1) * (N_DAYS - 1) + (N_GLOBAL - 1)
+    )
+    assert ("recovered_global", "us_total_rows") not in report.index
+    assert ("recovered_global", "negative_deltas") not in report.index
+    assert report["etl_load_time"].nunique() == 1
+
+    # every run appends its own report
+    covid.run_pipeline()
+    assert len(quality_report(covid)) == 2 * len(report)
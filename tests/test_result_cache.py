@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+import dataversion
+from result_cache import ResultCache
+from synthetic import publish_body, synthetic_body
+
+N_PROCESSES = 6
+COMPUTE_SECONDS = 0.5
+# a cached call still running after this means it waits on a lock it can never get
+DEADLOCK_SECONDS = 10.0
+
+
+def slow_frame(marker):
+    """A cold result taking a while to compute, every computation appends to the marker file
+    """
+
+    with open(marker, "a") as f:
+        f.write("computed\n")
+    time.sleep(COMPUTE_SECONDS)
+    return pd.DataFrame({"value": range(1000)})
+
+
+def compute_in_process(directory, marker, start, results):
+    """Waits for every process to be ready, then reads the same cold key
+    """
+
+    cache = ResultCache(directory)
+    start.wait()
+    df = cache.get_or_compute("cold", lambda: slow_frame(marker))
+    results.put((len(df), cache.stats))
+
+
+def test_cold_key_is_computed_once_across_processes(tmp_path):
+    directory, marker = str(tmp_path / "cache"), str(tmp_path / "marker")
+    # fcntl locks are Linux and macOS only, as is fork
+    context = multiprocessing.get_context("fork")
+    start, queue = context.Barrier(N_PROCESSES), context.Queue()
+    processes = [
+        context.Process(
+            target=compute_in_process, args=(directory, marker, start, queue)
+        )
+        for _ in range(N_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=DEADLOCK_SECONDS) for _ in processes]
+    for process in processes:
+        process.join()
+
+    with open(marker) as f:
+        assert f.read().count("computed") == 1
+    assert [rows for rows, _ in results] == [1000] * N_PROCESSES
+    assert sum(stats["misses"] for _, stats in results) == 1
+    assert sum(stats["waits"] + stats["hits"] for _, stats in results) == (
+        N_PROCESSES - 1
+    )
+    assert not os.listdir(os.path.join(directory, "locks"))
+
+
+def test_nested_cached_calls_complete(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    inner = cache.wrap("inner", lambda n: n * 2)
+    outer = cache.wrap("outer", lambda n: inner(n) + 1)
+
+    # arguments whose outer and inner keys start alike, which a lock file per key prefix would have shared
+    n = next(
+        n
+        for n in range(100000)
+        if int(cache.key("outer", (n,), {})[:8], 16) % 256
+        == int(cache.key("inner", (n,), {})[:8], 16) % 256
+    )
+    result = []
+    thread = threading.Thread(target=lambda: result.append(outer(n)), daemon=True)
+    thread.start()
+    thread.join(DEADLOCK_SECONDS)
+
+    assert not thread.is_alive()
+    assert result == [n * 2 + 1]
+    assert outer(n) == n * 2 + 1
+    assert cache.stats["misses"] == 2 and cache.stats["hits"] == 1
+
+
+def test_data_version_ignores_readers_and_follows_publishes(
+    database, tmp_path, monkeypatch
+):
+    monkeypatch.setenv(dataversion.DB_DIR_ENV, str(tmp_path))
+
+    assert dataversion.data_version() == (None, None)
+    locations = pd.DataFrame(
+        {
+            "country": ["A", "B"],
+            "state": [None, None],
+            "latitude": [1.0, 2.0],
+            "longitude": [3.0, 4.0],
+        }
+    )
+    publish_body(database, synthetic_body(locations, n_days=30, seed=0))
+    published = dataversion.data_version()
+
+    # readers open and close connections on the write-ahead log
+    path = str(tmp_path / "covid_master.db")
+    for _ in range(3):
+        conn = sqlite3.connect(path)
+        conn.execute("SELECT COUNT(*) FROM covid_daily").fetchone()
+        assert dataversion.data_version() == published
+        conn.close()
+        assert dataversion.data_version() == published
+
+    publish_body(database, synthetic_body(locations, n_days=31, seed=1))
+    assert dataversion.data_version() != published
@@ -0,0 +1,147 @@
+import contextlib
+import datetime as dt
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from etl.scheduler import PipelineScheduler
+from etl.worldpop import WorldPopPipepine
+from test_worldpop import PAGE
+from utils import RunStateUpdates, WorldPopUpdates
+
+
+class ValidatorHandler(BaseHTTPRequestHandler):
+    """Serves the page of its server with the ETag and Last-Modified validators of its server
+    """
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Last-Modified", self.server.last_modified)
+        self.send_header("Content-Length", str(len(self.server.page)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.do_HEAD()
+        self.wfile.write(self.server.page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def source():
+    """A source whose page and validators the tests change between runs
+
+    Yields:
+        ThreadingHTTPServer: server of the source, its url as url attribute
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ValidatorHandler)
+    server.etag = '"v1"'
+    server.last_modified = "Mon, 01 Jun 2020 00:00:00 GMT"
+    with open(PAGE, "rb") as f:
+        server.page = f.read()
+    server.url = "http://127.0.0.1:{}/population/".format(server.server_port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = RunStateUpdates()
+    state.project_root = str(tmp_path)
+    return state
+
+
+def scheduler(source, state, runs, force=False):
+    """A scheduler of one pipeline reading the source, which appends to runs instead of loading
+    """
+
+    scheduler = PipelineScheduler(force=force, state=state)
+    scheduler.source_urls = {"world_population": [source.url]}
+    scheduler.ttl_hours = {"world_population": 24}
+    scheduler.pipelines = {"world_population": lambda: runs.append(1)}
+    return scheduler
+
+
+def age(state, hours):
+    """Moves the last success of the pipeline hours back, keeping its fingerprint
+    """
+
+    with state:
+        last_success, fingerprint = state.read_state("world_population")
+        state.record_success(
+            "world_population", fingerprint, last_success - dt.timedelta(hours=hours)
+        )
+
+
+def test_due_fresh_unchanged_and_forced_runs(source, state):
+    runs = []
+    assert scheduler(source, state, runs).run() == {"world_population": "success"}
+    assert scheduler(source, state, runs).run() == {"world_population": "fresh"}
+    assert len(runs) == 1
+
+    # past its TTL, but the source validators did not change
+    age(state, 48)
+    assert scheduler(source, state, runs).run() == {"world_population": "unchanged"}
+    assert len(runs) == 1
+    # confirmed unchanged, so fresh again
+    assert scheduler(source, state, runs).run() == {"world_population": "fresh"}
+
+    age(state, 48)
+    source.etag = '"v2"'
+    assert scheduler(source, state, runs).run() == {"world_population": "success"}
+    assert len(runs) == 2
+
+    assert scheduler(source, state, runs, force=True).run() == {
+        "world_population": "success"
+    }
+    assert len(runs) == 3
+
+
+def test_unreachable_source_is_due(source, state):
+    runs = []
+    scheduler(source, state, runs).run()
+    age(state, 48)
+    source.shutdown()
+    source.server_close()
+    assert scheduler(source, state, runs).run() == {"world_population": "success"}
+    assert len(runs) == 2
+
+
+def test_failed_scrape_keeps_the_population_table(source, state, tmp_path):
+    database = WorldPopUpdates()
+    database.project_root = str(tmp_path)
+    pipeline = WorldPopPipepine(database)
+    pipeline.source_url = source.url
+    population = scheduler(source, state, [])
+    population.pipelines = {"world_population": pipeline.run_pipeline}
+
+    assert population.run() == {"world_population": "success"}
+    age(state, 48)
+    # the page changed, and lost a cell of the Canada row
+    source.etag = '"v2"'
+    source.page = source.page.replace(b"<td>242,032</td>", b"", 1)
+    result = population.run()["world_population"]
+    assert isinstance(result, ValueError)
+
+    path = str(tmp_path / "population.db")
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        tables = [
+            row[0]
+            for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        ]
+        rows = conn.execute(
+            "SELECT country, net_migrants FROM world_population WHERE id = 38"
+        ).fetchall()
+    assert tables == ["world_population"]
+    assert rows == [("Canada", 242032)]
+    # still due, the failed run was not recorded
+    with state:
+        last_success, fingerprint = state.read_state("world_population")
+    assert dt.datetime.now() - last_success > dt.timedelta(hours=24)
@@ -0,0 +1,304 @@
+import contextlib
+import functools
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.async_runner import PipelinedRunner
+from etl.constants import ETLConfigs
+from etl.covid_daily import CovidPipeline
+from etl.daemon import ETLDaemon
+from etl.sources import SourceRegistry
+from utils import DBUpdates
+
+N_GLOBAL = 120
+N_USA = 40
+N_DAYS = 60
+
+
+def write_sources(
+    directory, extra_day=False, revise=None, revise_recovered=None, shift_recovered=0.0,
+):
+    """Writes a small csv of every JHU time series of ETLConfigs.SOURCES, named after its source.
+    The recovered series is a third measure of the global region: it lags a day behind,
+    misses the first locations and has a location of its own
+
+    Args:
+        directory (str): directory to write the csv files to
+        extra_day (bool, optional): adds a day to every series. Defaults to False.
+        revise (tuple, optional): location and day of the confirmed global series to revise. Defaults to None.
+        revise_recovered (tuple, optional): location and day of the recovered series to revise. Defaults to None.
+        shift_recovered (float, optional): added to the latitude of the recovered locations. Defaults to 0.0.
+    """
+
+    rng = np.random.RandomState(0)
+    n_columns = N_DAYS + (1 if extra_day else 0)
+    dates = pd.date_range("2020-01-22", periods=n_columns)
+    header = [f"{d.month}/{d.day}/{d:%y}" for d in dates]
+
+    def cumulative(n, seed):
+        daily = np.random.RandomState(seed).randint(0, 5, (n, N_DAYS + 1))
+        return np.cumsum(daily, axis=1)[:, :n_columns]
+
+    def write(name, places, values):
+        values = pd.DataFrame(values, columns=header[: values.shape[1]])
+        pd.concat([places.reset_index(drop=True), values], axis=1).to_csv(
+            os.path.join(directory, f"{name}.csv"), index=False
+        )
+
+    places = pd.DataFrame(
+        {
+            "Province/State": [
+                f"S{i}" if i % 2 == 0 else None for i in range(N_GLOBAL)
+            ],
+            "Country/Region": [f"C{i % 60}" for i in range(N_GLOBAL)],
+            "Lat": rng.uniform(-60, 60, N_GLOBAL).round(3),
+            "Long": rng.uniform(-180, 180, N_GLOBAL).round(3),
+        }
+    )
+    # dropped and renamed while validating the locations
+    places.loc[0, ["Country/Region", "Province/State"]] = ["US", None]
+    places.loc[1, "Country/Region"] = "Burma"
+    confirmed = cumulative(N_GLOBAL, 1)
+    if revise is not None:
+        confirmed[revise] += 7
+    write("confirmed_global", places, confirmed)
+    write("death_global", places, confirmed // 10)
+
+    recovered = confirmed[10:, :-1] // 3
+    if revise_recovered is not None:
+        recovered[revise_recovered] += 3
+    recovered = np.vstack([recovered, np.arange(1, recovered.shape[1] + 1)])
+    own = pd.DataFrame(
+        {
+            "Province/State": [None],
+            "Country/Region": ["Canada"],
+            "Lat": [56.1],
+            "Long": [-106.3],
+        }
+    )
+    recovered_places = pd.concat([places.iloc[10:], own], ignore_index=True)
+    recovered_places["Lat"] += shift_recovered
+    write("recovered_global", recovered_places, recovered)
+
+    usa = pd.DataFrame(
+        {
+            "UID": range(N_USA),
+            "iso2": "US",
+            "iso3": "USA",
+            "code3": 840,
+            "FIPS": range(N_USA),
+            "Admin2": [f"A{i}" for i in range(N_USA)],
+            "Province_State": [f"St{i % 10}" for i in range(N_USA)],
+            "Country_Region": "US",
+            "Lat": rng.uniform(25, 48, N_USA).round(3),
+            "Long_": rng.uniform(-120, -70, N_USA).round(3),
+            "Combined_Key": "x",
+        }
+    )
+    # unassigned counties share their coordinates
+    usa.loc[N_USA - 4 :, ["Lat", "Long_"]] = 0.0
+    confirmed_usa = cumulative(N_USA, 2)
+    write("confirmed_usa", usa, confirmed_usa)
+    write("death_usa", usa.assign(Population=5), confirmed_usa // 20)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def served(tmp_path):
+    """Serves the csv files of write_sources() over HTTP, with Last-Modified headers as the JHU repository
+
+    Yields:
+        tuple: directory of the csv files and its url
+    """
+
+    directory = tmp_path / "sources"
+    directory.mkdir()
+    write_sources(str(directory))
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(directory))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield str(directory), "http://127.0.0.1:{}".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def registry(url, key_columns=None):
+    """The sources of ETLConfigs.SOURCES, downloaded from the served csv files
+
+    Args:
+        url (str): url of the csv files
+        key_columns (list, optional): key columns of the global sources. Defaults to None, as registered.
+    """
+
+    sources = {}
+    for name, source in ETLConfigs.SOURCES.items():
+        sources[name] = dict(source, url=f"{url}/{name}.csv")
+        if key_columns is not None and source["region"] == "global":
+            sources[name]["key_columns"] = key_columns
+    return SourceRegistry(sources)
+
+
+def pipeline(directory, sources):
+    """A CovidPipeline writing covid_master.db to its own directory
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    database = DBUpdates()
+    database.project_root = str(directory)
+    return CovidPipeline(database, sources=sources)
+
+
+def published(pipeline):
+    """Reads the published rows and geo grid, in a stable order and without the load time
+
+    Returns:
+        tuple: covid_daily and geo_grid DataFrames
+    """
+
+    path = f"{pipeline.database.project_root}/covid_master.db"
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        daily = pd.read_sql_query("SELECT * FROM covid_daily", conn)
+        grid = pd.read_sql_query("SELECT * FROM geo_grid", conn)
+    daily = daily.drop(columns="etl_load_time").sort_values(
+        ETLConfigs.LOCATION_COLUMNS + ["date", "confirmed", "recovered"],
+        na_position="first",
+    )
+    grid = grid.sort_values(list(grid.columns[:3]))
+    return daily.reset_index(drop=True), grid.reset_index(drop=True)
+
+
+def count(pipeline, table):
+    path = f"{pipeline.database.project_root}/covid_master.db"
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def assert_same_tables(left, right):
+    for left_table, right_table in zip(published(left), published(right)):
+        pd.testing.assert_frame_equal(left_table, right_table)
+
+
+def test_registry_validates_sources():
+    sources = SourceRegistry()
+    assert sources.measures() == ["confirmed", "death", "recovered"]
+    assert sources.groups()["global"]["recovered"] == "recovered_global"
+
+    with pytest.raises(ValueError, match="already holds"):
+        sources.register("other_confirmed", "url", region="global", measure="confirmed")
+    with pytest.raises(ValueError, match="can not be used"):
+        sources.register("dates", "url", region="global", measure="date")
+    with pytest.raises(ValueError, match="must be location columns"):
+        sources.register(
+            "tested_global", "url", region="global", measure="tested", key_columns=["x"]
+        )
+    with pytest.raises(ValueError, match="keys the locations of global"):
+        sources.register(
+            "tested_global",
+            "url",
+            region="global",
+            measure="tested",
+            key_columns=["country", "state"],
+        )
+    sources.register(
+        "tested_usa", "url", region="usa", measure="tested", key_columns=None
+    )
+    assert sources.measures()[-1] == "tested"
+
+
+def test_full_and_pipelined_loads_match(served, tmp_path):
+    _, url = served
+    sequential = pipeline(tmp_path / "sequential", registry(url))
+    sequential.run_pipeline()
+    pipelined = pipeline(tmp_path / "pipelined", registry(url))
+    PipelinedRunner(pipelined).run_pipeline()
+
+    assert_same_tables(sequential, pipelined)
+    assert count(pipelined, "source_hashes") == count(sequential, "source_hashes") > 0
+    daily, _ = published(sequential)
+    # a location of the recovered series only, and one missing from it
+    canada = daily[daily["country"] == "Canada"]
+    assert canada["confirmed"].isna().all() and canada["recovered"].notna().all()
+    assert daily[daily["country"] == "Myanmar"]["recovered"].isna().all()
+    assert daily[daily["country"] == "United States"]["recovered"].isna().all()
+    assert not (daily["country"] == "Burma").any()
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        {"extra_day": True},
+        {"revise": (5, 40)},
+        {"revise_recovered": (3, 30)},
+        {"extra_day": True, "revise": (5, 40), "revise_recovered": (3, 30)},
+    ],
+    ids=["new_day", "confirmed", "recovered", "all"],
+)
+@pytest.mark.parametrize(
+    "key_columns", [None, ["country", "state"]], ids=["locations", "names"]
+)
+def test_incremental_load_matches_full_load(served, tmp_path, change, key_columns):
+    directory, url = served
+    if key_columns is not None:
+        # the recovered coordinates do not match, its locations are aligned on their names
+        write_sources(directory, shift_recovered=0.5)
+    incremental = pipeline(tmp_path / "incremental", registry(url, key_columns))
+    # the first run falls back to a full reload
+    incremental.run_incremental()
+    assert count(incremental, "covid_changelog") == 0
+
+    write_sources(
+        directory, shift_recovered=0.5 if key_columns is not None else 0.0, **change
+    )
+    incremental.run_incremental()
+    full = pipeline(tmp_path / "full", registry(url, key_columns))
+    full.run_pipeline()
+
+    # revised in place, not reloaded
+    assert 0 < incremental.rows_written < count(full, "covid_daily") / 10
+    assert count(incremental, "covid_changelog") > 0
+    assert_same_tables(incremental, full)
+
+
+def test_daemon_only_diffs_downloaded_sources(served, tmp_path, monkeypatch):
+    directory, url = served
+    daemon = ETLDaemon(pipeline(tmp_path / "daemon", registry(url)))
+    assert daemon.poll()
+    assert not daemon.poll()
+
+    # only the recovered series is published again
+    revised = tmp_path / "revised"
+    revised.mkdir()
+    write_sources(str(revised), revise_recovered=(3, 30))
+    path = os.path.join(directory, "recovered_global.csv")
+    shutil.copy(str(revised / "recovered_global.csv"), path)
+    later = time.time() + 5
+    os.utime(path, (later, later))
+
+    diffed = []
+    diff_source = daemon.pipeline.diff_source
+    monkeypatch.setattr(
+        daemon.pipeline,
+        "diff_source",
+        lambda source, *args: diffed.append(source) or diff_source(source, *args),
+    )
+    assert daemon.poll()
+    assert diffed == ["recovered_global"]
+    assert daemon.metrics["source_downloads_total"] == len(ETLConfigs.SOURCES) + 1
+    assert 0 < daemon.pipeline.rows_written <= N_DAYS
+
+    full = pipeline(tmp_path / "full", registry(url))
+    full.run_pipeline()
+    assert_same_tables(daemon.pipeline, full)
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.constants import WorldPopConfig
+from etl.worldpop import WorldPopPipepine
+
+PAGE = os.path.join(
+    os.path.dirname(__file__), "fixtures", "worldometer_population.html"
+)
+
+
+@pytest.fixture
+def page():
+    """A saved Worldometer population page, trimmed to a few countries
+    """
+
+    with open(PAGE, "rb") as f:
+        return f.read()
+
+
+def test_headers_map_to_columns(page):
+    pipeline = WorldPopPipepine(worldpopdb=object())
+    pipeline.body = pipeline.parse_table(page)
+    assert list(pipeline.body.columns) == list(WorldPopConfig.HEADER_DICT)
+
+    pipeline.transform()
+    assert list(pipeline.body.columns) == list(WorldPopConfig.HEADER_DICT.values())
+    assert len(pipeline.body) == 11
+    # renamed for pycountry, after the html entities are decoded
+    countries = set(pipeline.body["country"])
+    assert {"Congo", "Czechia", "Sao Tome and Principe", "Faroe Islands"} <= countries
+    assert "DR Congo" not in countries
+
+
+def test_numbers_are_parsed(page):
+    pipeline = WorldPopPipepine(worldpopdb=object())
+    parsed = pipeline.parse_numeric(pd.Series(["N.A.", "1,234", "1.02 %", "-348,399"]))
+    assert np.isnan(parsed[0])
+    assert parsed[1:].tolist() == [1234, 1.02, -348399]
+
+    df = pipeline.parse_table(page).set_index("Country (or dependency)")
+    assert df.loc["China", "Population (2020)"] == 1439323776
+    assert df.loc["China", "Yearly Change"] == 0.39
+    assert df.loc["China", "Migrants (net)"] == -348399
+    assert np.isnan(df.loc["Holy See", "Med. Age"])
+    assert df.loc["Holy See", "World Share"] == 0.0
+    assert pd.api.types.is_numeric_dtype(df["Urban Pop %"])
+
+
+def test_short_row_raises(page):
+    # a cell missing from the Canada row, which zipping the rows would have silently truncated
+    broken = page.replace(b"<td>242,032</td>", b"", 1)
+    assert broken != page
+    with pytest.raises(ValueError, match="Row 5 .* 11 cells for 12 headers"):
+        WorldPopPipepine(worldpopdb=object()).parse_table(broken)
@@ -1,15 +1,92 @@
 import os
 import datetime as dt
+import functools
 import sqlite3
+import pandas as pd
 
-from etl.constants import ETLConfigs, WorldPopConfig, DBViewConfig
+from etl.constants import ETLConfigs, WorldPopConfig, SchedulerConfig, DBViewConfig
 
 
 def project_root():
     return os.path.dirname(os.path.abspath(__file__))
 
 
-class DBUpdates:
+@functools.lru_cache(maxsize=None)
+def read_sql_script(script):
+    """Reads a SQL script from the sql directory, once per process
+
+    Args:
+        script (str): name of the script, without extension
+
+    Returns:
+        str: contents of the script
+    """
+
+    with open("{}/sql/{}.sql".format(project_root(), script)) as sql:
+        return sql.read()
+
+
+class SQLiteResource:
+    """Base class for a lazily opened SQLite3 connection
+
+    The connection is only opened when first used, and closed when leaving the context manager,
+    so importing and instantiating does no I/O and every run gets a fresh connection.
+        with DBUpdates() as database:
+            database.create_table()
+    """
+
+    database_name = None
+
+    def __init__(self):
+        self.project_root = project_root()
+        self._conn = None
+        self._cur = None
+
+    def open(self):
+        """Opens the DB connection, unless it is already open
+        """
+
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                "{}/{}.db".format(self.project_root, self.database_name)
+            )
+            self._cur = self._conn.cursor()
+            self.on_connect()
+
+    @property
+    def conn(self):
+        self.open()
+        return self._conn
+
+    @property
+    def cur(self):
+        self.open()
+        return self._cur
+
+    def on_connect(self):
+        """Hook to prepare a newly opened connection
+        """
+
+        pass
+
+    def close(self):
+        """Closes the DB connection if it is open
+        """
+
+        if self._conn is not None:
+            self._cur.close()
+            self._conn.close()
+            self._conn = None
+            self._cur = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DBUpdates(SQLiteResource):
     """Class for wrapping all the scripte related to updating the SQLite3 database
     """
 
@@ -17,63 +94,198 @@ class DBUpdates:
         """Setting all constants and props required to run SQL commands
         """
 
+        super().__init__()
+
         # Static properties
-        self.project_root = project_root()
         self.database_name = ETLConfigs.DB_NAME
         self.table_name = ETLConfigs.TABLE_NAME
         self.setup_command = ETLConfigs.SETUP_SQL_SCRIPT
         self.swap_command = ETLConfigs.SWAP_SQL_SCRIPT
+        self.grid_command = ETLConfigs.GRID_SQL_SCRIPT
+        self.grid_locations_command = ETLConfigs.GRID_LOCATIONS_SQL_SCRIPT
+        self.index_command = ETLConfigs.INDEX_SQL_SCRIPT
+        self.revisions_command = ETLConfigs.REVISIONS_SQL_SCRIPT
+        self.revise_grid_command = ETLConfigs.REVISE_GRID_SQL_SCRIPT
+        self.views_command = DBViewConfig.SQL_SCRIPT
+        self.grid_cell_degrees = ETLConfigs.GRID_CELL_DEGREES
         self.sql_dtypes = ETLConfigs.SQL_DTYPES
+        self.hash_sql_dtypes = ETLConfigs.HASH_SQL_DTYPES
+        self.quality_table_name = ETLConfigs.QUALITY_TABLE_NAME
+        self.quality_sql_dtypes = ETLConfigs.QUALITY_SQL_DTYPES
 
-        # SQL scripts
-        with open(
-            "{}/sql/{}.sql".format(self.project_root, self.setup_command)
-        ) as setup_sql:
-            self.setup_sql_command = setup_sql.read()
-        with open(
-            "{}/sql/{}.sql".format(self.project_root, self.swap_command)
-        ) as swap_sql:
-            self.swap_sql_command = swap_sql.read()
-
-        # Create/establish DB connection
-        self.conn = sqlite3.connect(
-            "{}/{}.db".format(self.project_root, self.database_name)
-        )
-        self.cur = self.conn.cursor()
+    def on_connect(self):
+        """WAL lets dashboard readers keep their snapshot while the tables are published
+        """
+
+        self.cur.execute("PRAGMA journal_mode=WAL").fetchone()
+        self.cur.execute("PRAGMA synchronous=NORMAL")
 
     def create_table(self):
         """Executes setup SQL commands to create staging table
         """
 
-        self.cur.execute(self.setup_sql_command)
+        self.cur.executescript(read_sql_script(self.setup_command))
         self.conn.commit()
 
-    def insert_to_table(self, df):
+    def insert_to_table(self, df, if_exists="replace"):
         """Loads the completed DataFrame into staging table
 
         Args:
             df (pd.DataFrame): payload containing the ready data object to db insert
+            if_exists (str, optional): "replace" to recreate the staging table, "append" to add
+                to it when loading in batches. Defaults to "replace".
         """
 
         df.to_sql(
             name="covid_daily_new",
             con=self.conn,
             dtype=self.sql_dtypes,
+            if_exists=if_exists,
+            index=False,
+        )
+
+    def grid_parameters(self):
+        """Yields the parameters of the geo grid SQL scripts for every zoom level
+        """
+
+        for zoom, cell_degrees in self.grid_cell_degrees.items():
+            yield {
+                "zoom": zoom,
+                "cell_degrees": cell_degrees,
+                "max_row": int(round(180 / cell_degrees)) - 1,
+                "max_col": int(round(360 / cell_degrees)) - 1,
+            }
+
+    def build_geo_grid(self):
+        """Aggregates the staging table into fixed grid cells for every zoom level,
+        so that map queries only read the cells in view.
+        The staging table is collapsed to one row per location first, every zoom level is built from it
+        """
+
+        self.cur.executescript(
+            read_sql_script(self.grid_locations_command).format(
+                source_table="covid_daily_new"
+            )
+        )
+        for params in self.grid_parameters():
+            self.cur.execute(
+                read_sql_script(self.grid_command).format(
+                    target_table="geo_grid_new", **params
+                )
+            )
+        self.cur.execute("DROP TABLE temp.grid_locations")
+        self.conn.commit()
+
+    def read_source_hashes(self):
+        """Reads the source block hashes stored by the last published run
+
+        Returns:
+            pd.DataFrame: one row per source, location and block of date columns.
+                Empty if the database has never been loaded
+        """
+
+        exists = self.cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'source_hashes'"
+        ).fetchone()
+        if exists is None:
+            return pd.DataFrame(columns=list(self.hash_sql_dtypes))
+        return pd.read_sql_query("SELECT * FROM source_hashes", self.conn)
+
+    def insert_source_hashes(self, df):
+        """Loads the source block hashes into staging, they are published along with the data
+
+        Args:
+            df (pd.DataFrame): hashes from RevisionDetector.diff()
+        """
+
+        df.to_sql(
+            name="source_hashes_new",
+            con=self.conn,
+            dtype=self.hash_sql_dtypes,
+            if_exists="append",
+            index=False,
+        )
+
+    def apply_revisions(self, df, hashes):
+        """Rewrites revised rows of the live table in a single write transaction.
+        The matching rows are replaced, the totals of the affected geo grid cells are updated,
+        the changes are recorded in covid_changelog and the changed hashes are stored
+
+        Args:
+            df (pd.DataFrame): revised rows, in the same format as the staging payload
+            hashes (pd.DataFrame): changed hashes from RevisionDetector.diff()
+        """
+
+        df.to_sql(
+            name="covid_daily_revised",
+            con=self.conn,
+            dtype=self.sql_dtypes,
+            if_exists="replace",
+            index=False,
+        )
+        hashes.to_sql(
+            name="source_hashes_revised",
+            con=self.conn,
+            dtype=self.hash_sql_dtypes,
             if_exists="replace",
             index=False,
         )
+        # the totals of the affected cells are shifted by the revised minus the replaced rows,
+        # revisions never add or remove a location, so the cell centroids and location counts hold
+        grid_revisions = [
+            read_sql_script(self.revise_grid_command).format(**params)
+            for params in self.grid_parameters()
+        ]
+        self.cur.executescript(
+            "BEGIN IMMEDIATE;\n{}\nCOMMIT;".format(
+                read_sql_script(self.revisions_command).format(
+                    columns=", ".join(df.columns),
+                    grid_revisions="\n".join(grid_revisions),
+                )
+            )
+        )
 
-    def swap_tables(self):
-        """Executes SQL commands to swap, and drop tables
+    def insert_quality_report(self, df):
+        """Appends the quality report of a run, once its data is published
+
+        Args:
+            df (pd.DataFrame): findings from QualityChecker.report()
         """
 
-        self.cur.executescript(self.swap_sql_command)
+        df.to_sql(
+            name=self.quality_table_name,
+            con=self.conn,
+            dtype=self.quality_sql_dtypes,
+            if_exists="append",
+            index=False,
+        )
         self.conn.commit()
-        self.cur.close()
-        self.conn.close()
+
+    def create_staging_indexes(self):
+        """Builds the indexes of the staging tables before they are published.
+        Index names are global to the database, so they carry a per-run suffix
+        to avoid clashing with the indexes of the live tables
+        """
+
+        suffix = dt.datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self.cur.executescript(
+            read_sql_script(self.index_command).format(suffix=suffix)
+        )
+        self.conn.commit()
+
+    def publish(self):
+        """Swaps the staging tables in and recreates the views in a single write transaction,
+        so readers either see the previous tables and views or the new ones
+        """
+
+        self.cur.executescript(
+            "BEGIN IMMEDIATE;\n{}\n{}\nCOMMIT;".format(
+                read_sql_script(self.swap_command), read_sql_script(self.views_command)
+            )
+        )
 
 
-class WorldPopUpdates:
+class WorldPopUpdates(SQLiteResource):
     """Class for wrapping all the scripte related to updating the SQLite3 database
     """
 
@@ -81,75 +293,104 @@ class WorldPopUpdates:
         """Setting all constants and props required to run SQL commands
         """
 
+        super().__init__()
+
         # Static properties
-        self.project_root = project_root()
         self.database_name = WorldPopConfig.DB_NAME
         self.table_name = WorldPopConfig.TABLE_NAME
+        self.staging_table_name = WorldPopConfig.STAGING_TABLE_NAME
         self.setup_sql_command = WorldPopConfig.SETUP_SQL
+        self.swap_sql_command = WorldPopConfig.SWAP_SQL
         self.sql_dtypes = WorldPopConfig.SQL_DTYPES
 
-        # Create/establish DB connection
-        self.conn = sqlite3.connect(
-            "{}/{}.db".format(self.project_root, self.database_name)
-        )
-        self.cur = self.conn.cursor()
+    def on_connect(self):
+        """WAL lets dashboard readers keep their snapshot while the table is swapped
+        """
 
-    def drop_existing_table(self):
-        """Executes the setup commands to drop existing tables if any
+        self.cur.execute("PRAGMA journal_mode=WAL").fetchone()
+
+    def drop_staging_table(self):
+        """Executes the setup commands to drop the staging table left over by a failed run, if any
         """
 
         self.cur.execute(self.setup_sql_command)
         self.conn.commit()
 
     def create_insert_table(self, df):
-        """Create the table to insert data into
+        """Create the staging table to insert data into
 
         Args:
             df (pd.DataFrame): payload containing the ready data object to db insert
         """
 
         df.to_sql(
-            name=self.table_name,
+            name=self.staging_table_name,
             con=self.conn,
             dtype=self.sql_dtypes,
             if_exists="replace",
             index=False,
         )
         self.conn.commit()
-        self.cur.close()
-        self.conn.close()
+
+    def swap_tables(self):
+        """Replaces the live table with the staging table in a single write transaction
+        """
+
+        self.cur.executescript(self.swap_sql_command)
 
 
-class CreateViews:
-    """Create views in the covid database that will summarize the daily data
+class RunStateUpdates(SQLiteResource):
+    """Class for wrapping the SQL commands tracking the last successful run of each pipeline
     """
 
     def __init__(self):
         """Setting all constants and props required to run SQL commands
         """
 
+        super().__init__()
+
         # Static properties
-        self.project_root = project_root()
-        self.database_name = DBViewConfig.DB_NAME
-        self.sql_script = DBViewConfig.SQL_SCRIPT
-
-        # SQL scripts
-        with open(
-            "{}/sql/{}.sql".format(self.project_root, self.sql_script)
-        ) as setup_sql:
-            self.sql_command = setup_sql.read()
-
-        # Create/establish DB connection
-        self.conn = sqlite3.connect(
-            "{}/{}.db".format(self.project_root, self.database_name)
-        )
-        self.cur = self.conn.cursor()
+        self.database_name = SchedulerConfig.DB_NAME
+        self.table_name = SchedulerConfig.TABLE_NAME
+        self.setup_sql_command = SchedulerConfig.SETUP_SQL
 
-    def create_views(self):
-        """Executes SQL commands to create views
+    def on_connect(self):
+        """Creates the run state table on first use
         """
 
-        self.cur.executescript(self.sql_command)
+        self.cur.execute(self.setup_sql_command)
+        self.conn.commit()
+
+    def read_state(self, pipeline):
+        """Reads the last recorded state of a pipeline
+
+        Args:
+            pipeline (str): name of the pipeline
+
+        Returns:
+            tuple: (last_success, fingerprint), both None if the pipeline never succeeded
+        """
+
+        row = self.cur.execute(
+            f"SELECT last_success, fingerprint FROM {self.table_name} WHERE pipeline = ?",
+            (pipeline,),
+        ).fetchone()
+        if row is None:
+            return None, None
+        last_success = dt.datetime.fromisoformat(row[0]) if row[0] else None
+        return last_success, row[1]
+
+    def record_success(self, pipeline, fingerprint, success_time):
+        """Records that a pipeline's data is current as of success_time
+
+        Args:
+            pipeline (str): name of the pipeline
+            fingerprint (str): fingerprint of the sources the data was loaded from
+            success_time (datetime): time the run started
+        """
+
+        self.cur.execute(
+            f"INSERT OR REPLACE INTO {self.table_name} VALUES (?, ?, ?)",
+            (pipeline, success_time.isoformat(), fingerprint),
+        )
         self.conn.commit()
-        self.cur.close()
-        self.conn.close()